@@ -0,0 +1,284 @@
+"""
+Exact inner-product scoring kernels over a contiguous (N, D) float32 or float16 matrix.
+
+Numba is optional: when it is installed the kernels are JIT-compiled (and cached on disk, so
+only the first process run pays the compile), otherwise the BLAS-backed NumPy path is used.
+Half-precision matrices are widened one cache-sized block at a time and scored with BLAS.
+
+Int8 matrices carry one float16 absmax scale per row. The query is quantized the same way, the
+integer dot products are accumulated exactly and both scales are applied once per row afterwards
+instead of dequantizing every element.
+
+Threshold counts can also run over a PDX ("partition dimensions across") copy of the matrix: blocks
+of `PDX_BLOCK` vectors stored dimension-major, so each step of the inner loop updates that many
+independent accumulators and no per-vector horizontal reduction is needed.
+
+With numba, exact top-k over unit-norm rows abandons a row once its partial dot product plus a
+Cauchy-Schwarz bound on the remaining dimensions can no longer beat the current k-th best score.
+"""
+import math
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Rows widened to float32 per step when scoring a float16 or int8 matrix (~2 MB at D=512).
+_CONVERT_BLOCK_ROWS = 1024
+_INT8_MAX = 127
+# Vectors per PDX block; one block's accumulators fit in a few SIMD registers.
+PDX_BLOCK = 64
+# Dimensions scored between early-abort checks in the top-k kernel.
+EARLY_ABORT_BLOCK = 64
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _scores_kernel(matrix, query, out):
+        n, d = matrix.shape
+        for i in prange(n):
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += matrix[i, j] * query[j]
+            out[i] = acc
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _count_kernel(matrix, query, threshold):
+        n, d = matrix.shape
+        total = 0
+        for i in prange(n):
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += matrix[i, j] * query[j]
+            if acc >= threshold:
+                total += 1
+        return total
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _pdx_count_kernel(blocks, n, query, threshold):
+        num_blocks, d, width = blocks.shape
+        counts = np.zeros(num_blocks, dtype=np.int64)
+        for block in prange(num_blocks):
+            acc = np.zeros(width, dtype=np.float32)
+            for j in range(d):
+                q = query[j]
+                for lane in range(width):
+                    acc[lane] += q * blocks[block, j, lane]
+            # Padding lanes of the last block score 0 and must not be counted.
+            valid = min(width, n - block * width)
+            total = 0
+            for lane in range(valid):
+                if acc[lane] >= threshold:
+                    total += 1
+            counts[block] = total
+        return counts.sum()
+
+    @njit(fastmath=True, cache=True)
+    def _topk_early_abort_kernel(matrix, query, query_tail_norms, k, block, heap_scores, heap_rows):
+        n, d = matrix.shape
+        size = 0
+        for i in range(n):
+            partial = np.float32(0.0)
+            seen_sq = np.float32(0.0)
+            abandoned = False
+            for start in range(0, d, block):
+                stop = min(start + block, d)
+                for j in range(start, stop):
+                    value = matrix[i, j]
+                    partial += value * query[j]
+                    seen_sq += value * value
+                if size == k and stop < d:
+                    # ||row[stop:]|| <= sqrt(1 - ||row[:stop]||^2) for unit rows.
+                    bound = math.sqrt(max(np.float32(0.0), np.float32(1.0) - seen_sq)) * query_tail_norms[stop]
+                    if partial + bound <= heap_scores[0]:
+                        abandoned = True
+                        break
+            if abandoned:
+                continue
+            if size < k:
+                # Sift the new entry up the min-heap.
+                pos = size
+                size += 1
+                while pos > 0:
+                    parent = (pos - 1) // 2
+                    if heap_scores[parent] <= partial:
+                        break
+                    heap_scores[pos] = heap_scores[parent]
+                    heap_rows[pos] = heap_rows[parent]
+                    pos = parent
+                heap_scores[pos] = partial
+                heap_rows[pos] = i
+            elif partial > heap_scores[0]:
+                # Replace the root (current k-th best) and sift down.
+                pos = 0
+                while True:
+                    child = 2 * pos + 1
+                    if child >= size:
+                        break
+                    if child + 1 < size and heap_scores[child + 1] < heap_scores[child]:
+                        child += 1
+                    if heap_scores[child] >= partial:
+                        break
+                    heap_scores[pos] = heap_scores[child]
+                    heap_rows[pos] = heap_rows[child]
+                    pos = child
+                heap_scores[pos] = partial
+                heap_rows[pos] = i
+        return size
+
+    @njit(parallel=True, cache=True)
+    def _int8_dot_kernel(matrix, query, out):
+        n, d = matrix.shape
+        for i in prange(n):
+            acc = np.int32(0)
+            for j in range(d):
+                acc += np.int32(matrix[i, j]) * np.int32(query[j])
+            out[i] = acc
+
+
+def quantize_rows(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row absmax quantization to int8 codes and float16 scales (zero rows stay zero)."""
+    scales = (np.abs(vectors).max(axis=1) / _INT8_MAX).astype(np.float16)
+    divisors = np.where(scales > 0, scales, 1).astype(np.float32)
+    codes = np.clip(np.rint(vectors / divisors[:, None]), -_INT8_MAX, _INT8_MAX).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_rows(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales.astype(np.float32)[:, None]
+
+
+def inner_product_scores(
+    matrix: np.ndarray,
+    query: np.ndarray,
+    row_scales: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Return `matrix @ query` as float32; int8 matrices need their per-row `row_scales`."""
+    if row_scales is not None:
+        return _int8_scores(matrix, row_scales, query)
+    if matrix.dtype != np.float32:
+        return _blockwise_scores(matrix, query)
+    if NUMBA_AVAILABLE:
+        out = np.empty(matrix.shape[0], dtype=np.float32)
+        _scores_kernel(matrix, query, out)
+        return out
+    return matrix @ query
+
+
+def inner_product_scores_batch(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    row_scales: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """(N, B) scores of every matrix row against each of the (B, D) `queries`."""
+    if row_scales is None and matrix.dtype == np.float32:
+        # One GEMM reads the matrix once for the whole batch.
+        return matrix @ queries.T
+    return np.stack([inner_product_scores(matrix, query, row_scales) for query in queries], axis=1)
+
+
+def _blockwise_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    out = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], _CONVERT_BLOCK_ROWS):
+        block = matrix[start : start + _CONVERT_BLOCK_ROWS].astype(np.float32)
+        np.dot(block, query, out=out[start : start + block.shape[0]])
+    return out
+
+
+def _int8_scores(codes: np.ndarray, row_scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    query_codes, query_scale = quantize_rows(query[None, :])
+    if NUMBA_AVAILABLE:
+        accumulated = np.empty(codes.shape[0], dtype=np.int32)
+        _int8_dot_kernel(codes, query_codes[0], accumulated)
+        accumulated = accumulated.astype(np.float32)
+    else:
+        # |sum| <= D * 127 * 127 stays below 2**24, so float32 BLAS sums of the codes are exact.
+        accumulated = _blockwise_scores(codes, query_codes[0].astype(np.float32))
+    return (accumulated * np.float32(query_scale[0])) * row_scales.astype(np.float32)
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row indices of the `k` highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k == 1:
+        # Best-match queries need one max reduction, not a partition plus sort.
+        return np.array([np.argmax(scores)], dtype=np.int64)
+    if k < scores.shape[0]:
+        rows = np.argpartition(-scores, k - 1)[:k]
+    else:
+        rows = np.arange(scores.shape[0])
+    return rows[np.argsort(-scores[rows], kind="stable")]
+
+
+def top_k_early_abort(matrix: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (rows, scores) of the `k` best rows of a unit-norm float32 `matrix`, best first, computed with the
+    early-abort numba kernel. Only call when `NUMBA_AVAILABLE`.
+    """
+    k = min(k, matrix.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    # query_tail_norms[j] = ||query[j:]||, with a trailing 0 for the full row.
+    tail_norms = np.sqrt(np.append(np.cumsum((query * query)[::-1])[::-1], 0)).astype(np.float32)
+    heap_scores = np.empty(k, dtype=np.float32)
+    heap_rows = np.empty(k, dtype=np.int64)
+    size = _topk_early_abort_kernel(matrix, query, tail_norms, k, EARLY_ABORT_BLOCK, heap_scores, heap_rows)
+    order = np.lexsort((heap_rows[:size], -heap_scores[:size]))
+    return heap_rows[order], heap_scores[order]
+
+
+def count_at_least(
+    matrix: np.ndarray,
+    query: np.ndarray,
+    threshold: float,
+    row_scales: Optional[np.ndarray] = None,
+) -> int:
+    """Count rows whose inner product with `query` is >= `threshold` without keeping the scores."""
+    if NUMBA_AVAILABLE and row_scales is None and matrix.dtype == np.float32:
+        return int(_count_kernel(matrix, query, np.float32(threshold)))
+    return int(np.count_nonzero(inner_product_scores(matrix, query, row_scales) >= threshold))
+
+
+def to_pdx(matrix: np.ndarray) -> np.ndarray:
+    """Copy an (N, D) matrix into zero-padded (ceil(N / PDX_BLOCK), D, PDX_BLOCK) float32 blocks."""
+    n, d = matrix.shape
+    num_blocks = -(-n // PDX_BLOCK)
+    padded = np.zeros((num_blocks * PDX_BLOCK, d), dtype=np.float32)
+    padded[:n] = matrix
+    return np.ascontiguousarray(padded.reshape(num_blocks, PDX_BLOCK, d).transpose(0, 2, 1))
+
+
+def pdx_set_row(blocks: np.ndarray, row: int, vector: np.ndarray) -> np.ndarray:
+    """Write one vector into PDX row `row`, doubling the block array when it is full."""
+    block, lane = divmod(row, PDX_BLOCK)
+    if block >= blocks.shape[0]:
+        grown = np.zeros((max(block + 1, 2 * blocks.shape[0]), *blocks.shape[1:]), dtype=np.float32)
+        grown[: blocks.shape[0]] = blocks
+        blocks = grown
+    blocks[block, :, lane] = vector
+    return blocks
+
+
+def pdx_move_row(blocks: np.ndarray, source: int, target: int):
+    """Move PDX row `source` into `target` and zero the vacated lane (swap-remove)."""
+    source_block, source_lane = divmod(source, PDX_BLOCK)
+    target_block, target_lane = divmod(target, PDX_BLOCK)
+    blocks[target_block, :, target_lane] = blocks[source_block, :, source_lane]
+    blocks[source_block, :, source_lane] = 0
+
+
+def count_at_least_pdx(blocks: np.ndarray, n: int, query: np.ndarray, threshold: float) -> int:
+    """`count_at_least` over the first `n` rows of a PDX block array."""
+    if NUMBA_AVAILABLE:
+        return int(_pdx_count_kernel(blocks, n, query, np.float32(threshold)))
+    scores = np.einsum("d,bdl->bl", query, blocks).reshape(-1)[:n]
+    return int(np.count_nonzero(scores >= threshold))
@@ -1,5 +1,6 @@
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from typing import Literal, Tuple
 
 from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -10,33 +11,105 @@ class AppConfig(BaseSettings):
 
     model_config = SettingsConfigDict(
         env_prefix="VISUAL_SEARCH_",
-        env_file=".env",
+        # The dotenv file is resolved once by get_settings(); direct constructions only read the environment.
+        env_file=None,
         env_file_encoding="utf-8",
     )
 
     # Catalog / index settings
     catalog_dir: Path = Field(default=Path("data/catalog"), description="Directory holding catalog imagery.")
     index_base_path: Path = Field(default=Path("data/catalog_index"), description="Base path for FAISS cache files.")
-    index_build_batch_size: int = Field(default=32, description="Images per batch when building FAISS index.")
-    index_build_workers: int = Field(default=4, description="Parallel workers for catalog loading.")
+    index_build_batch_size: int = Field(default=32, ge=1, description="Images per batch when building FAISS index.")
+    index_build_workers: int = Field(default=4, ge=1, description="Parallel workers for catalog loading.")
     cache_index_on_startup: bool = Field(default=True, description="Persist FAISS cache after building.")
-    catalog_default_page_size: int = Field(default=40, description="Default number of catalog images per page.")
-    catalog_max_page_size: int = Field(default=200, description="Maximum images per page in catalog browser.")
+    index_save_debounce_seconds: float = Field(
+        default=0.5,
+        ge=0,
+        description="Coalesce catalog edits within this window into one background index save.",
+    )
+    index_quantize_int8: bool = Field(
+        default=False,
+        description="Store catalog vectors in FAISS as int8 scalar-quantized codes with an FP32 rerank.",
+    )
+    index_store_fp16: bool = Field(
+        default=False,
+        description="Keep the exact-scoring feature matrix in float16 (half the memory and disk).",
+    )
+    index_store_int8: bool = Field(
+        default=False,
+        description="Keep the exact-scoring feature matrix as int8 rows with per-row scales (overrides float16).",
+    )
+    index_ivfpq_min_size: int = Field(
+        default=100_000,
+        ge=1,
+        description="Catalog size from which index rebuilds train an IVF-PQ index instead of a flat one.",
+    )
+    index_use_gpu: bool = Field(
+        default=True,
+        description="Search large flat indexes with FAISS on the GPU when faiss-gpu and CUDA are available.",
+    )
+    index_binary_prefilter: bool = Field(
+        default=False,
+        description="Pick search candidates by Hamming distance over sign bits before the FP32 rerank.",
+    )
+    catalog_default_page_size: int = Field(default=40, ge=1, description="Default number of catalog images per page.")
+    catalog_max_page_size: int = Field(default=200, ge=1, description="Maximum images per page in catalog browser.")
 
     # Feature extraction settings
     feature_model_name: str = Field(default="ViT-B-32", description="CLIP/OpenCLIP model name.")
     feature_model_pretrained: str = Field(default="openai", description="Pretrained weights identifier.")
     force_cpu: bool = Field(default=False, description="Force CPU execution even if GPU/MPS is available.")
+    feature_compile_model: bool = Field(
+        default=True,
+        description="Compile the CLIP visual tower with torch.compile when running on CUDA.",
+    )
+    feature_backend: Literal["torch", "onnx"] = Field(
+        default="torch",
+        description="Inference runtime for the visual tower (ONNX Runtime falls back to torch if missing).",
+    )
+    model_cache_dir: Path = Field(default=Path("data/models"), description="Directory for exported model files.")
+    onnx_quantize_int8: bool = Field(default=False, description="Dynamically quantize ONNX MatMul weights to int8.")
+    gpu_decode_enabled: bool = Field(
+        default=True,
+        description="Decode JPEG search uploads on the GPU with nvJPEG when CLIP runs on CUDA.",
+    )
 
     # Query augmentation settings
     query_use_horizontal_flip: bool = Field(default=True, description="Include a horizontal flip query variant.")
     query_use_center_crop: bool = Field(default=True, description="Include a center crop variant.")
-    query_crop_ratio: float = Field(default=0.8, description="Percent of the image kept when center-cropping.")
+    query_crop_ratio: float = Field(
+        default=0.8,
+        gt=0,
+        le=1,
+        description="Percent of the image kept when center-cropping.",
+    )
 
     # Search settings
-    search_default_top_k: int = Field(default=200, description="Fallback top-k when clients omit the value.")
-    search_min_similarity: float = Field(default=0.8, description="Minimum cosine similarity to treat as a match.")
-    search_results_page_size: int = Field(default=10, description="Frontend page size for the results grid.")
+    search_default_top_k: int = Field(default=200, ge=1, description="Fallback top-k when clients omit the value.")
+    search_min_similarity: float = Field(
+        default=0.8,
+        ge=0,
+        le=1,
+        description="Minimum cosine similarity to treat as a match.",
+    )
+    search_rerank_oversample: int = Field(
+        default=4,
+        ge=1,
+        description="Candidates fetched per requested result before the FP32 rerank of approximate indexes.",
+    )
+    search_nprobe: int = Field(default=16, ge=1, description="Inverted lists probed per query with IVF-PQ.")
+    search_exact_scan_max_size: int = Field(
+        default=10_000,
+        ge=0,
+        description="Flat catalogs below this size are scored by a direct matrix scan instead of FAISS.",
+    )
+    search_batch_window_ms: float = Field(
+        default=2.0,
+        ge=0,
+        description="Concurrent searches arriving within this window are scored in one batched call (0 disables).",
+    )
+    search_batch_max_size: int = Field(default=32, ge=1, description="Most queries coalesced into one batched search.")
+    search_results_page_size: int = Field(default=10, ge=1, description="Frontend page size for the results grid.")
 
     # Upload validation
     supported_image_formats: Tuple[str, ...] = Field(
@@ -60,55 +133,15 @@ class AppConfig(BaseSettings):
     # ------------------------------------------------------------------
     # Validators
     # ------------------------------------------------------------------
-    @field_validator(
-        "index_build_batch_size",
-        "index_build_workers",
-        "catalog_default_page_size",
-        "catalog_max_page_size",
-        "search_default_top_k",
-    )
-    @classmethod
-    def _validate_positive_int(cls, value: int, info):
-        if value < 1:
-            raise ValueError(f"{info.field_name} must be >= 1.")
-        return value
-
-    @field_validator("query_crop_ratio")
-    @classmethod
-    def _validate_crop_ratio(cls, value: float) -> float:
-        if not 0 < value <= 1:
-            raise ValueError("query_crop_ratio must be between 0 (exclusive) and 1 (inclusive).")
-        return value
-
-    @field_validator("search_min_similarity")
-    @classmethod
-    def _validate_similarity(cls, value: float) -> float:
-        if not 0 <= value <= 1:
-            raise ValueError("search_min_similarity must be between 0 and 1.")
-        return value
-
-    @field_validator("search_results_page_size")
-    @classmethod
-    def _validate_results_page_size(cls, value: int) -> int:
-        if value < 1:
-            raise ValueError("search_results_page_size must be >= 1.")
-        return value
-
     @field_validator("supported_image_formats")
     @classmethod
     def _normalize_formats(cls, value: Tuple[str, ...]) -> Tuple[str, ...]:
-        normalized: list[str] = []
-        for ext in value:
-            formatted = ext.strip().lower()
-            if not formatted:
-                continue
-            if not formatted.startswith("."):
-                formatted = f".{formatted}"
-            if formatted not in normalized:
-                normalized.append(formatted)
+        stripped = (ext.strip().lower() for ext in value)
+        # dict.fromkeys dedups while keeping the configured order.
+        normalized = tuple(dict.fromkeys(f".{ext.lstrip('.')}" for ext in stripped if ext))
         if not normalized:
             raise ValueError("supported_image_formats must include at least one extension.")
-        return tuple(normalized)
+        return normalized
 
     @model_validator(mode="after")
     def _validate_relationships(self) -> "AppConfig":
@@ -117,4 +150,11 @@ class AppConfig(BaseSettings):
         return self
 
 
-app_config = AppConfig()
+DEFAULT_ENV_FILE = Path(".env")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> AppConfig:
+    """Return the process-wide configuration, parsing the environment and .env file only once."""
+    env_file = DEFAULT_ENV_FILE if DEFAULT_ENV_FILE.exists() else None
+    return AppConfig(_env_file=env_file)
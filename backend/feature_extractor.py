@@ -1,20 +1,43 @@
+import contextlib
 import logging
+import os
 import time
-from contextlib import nullcontext
-from typing import Sequence
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
 
+import cv2
 import numpy as np
 import open_clip
 import torch
-from PIL import Image
+import torch.nn.functional as F
+from torchvision import transforms as T
+from torchvision.transforms import InterpolationMode
 
 from .gpu_utils import resolve_torch_device
 
 logger = logging.getLogger(__name__)
 
+# Batch sizes the compiled visual tower is specialized for; smaller batches are padded up.
+# 3 matches the full query ensemble (image + flip + center crop) so searches never pad.
+BATCH_BUCKETS: Tuple[int, ...] = (1, 2, 3, 4, 8, 16, 32)
+
+_CV2_INTERPOLATION = {
+    InterpolationMode.BICUBIC: cv2.INTER_CUBIC,
+    InterpolationMode.BILINEAR: cv2.INTER_LINEAR,
+    InterpolationMode.NEAREST: cv2.INTER_NEAREST,
+}
+
 
 class FeatureExtractor:
-    def __init__(self, model_name: str = "ViT-B-32", pretrained: str = "openai", *, force_cpu: bool = False):
+    def __init__(
+        self,
+        model_name: str = "ViT-B-32",
+        pretrained: str = "openai",
+        *,
+        force_cpu: bool = False,
+        compile_model: bool = True,
+        weights_cache_dir: Optional[Path] = None,
+    ):
         """
         Initialize CLIP-based feature extractor.
         """
@@ -25,14 +48,33 @@ class FeatureExtractor:
         self.device, device_name = resolve_torch_device(force_cpu=force_cpu)
         self.device_description = device_name
 
-        self.model, _, self.preprocess = open_clip.create_model_and_transforms(
-            model_name,
-            pretrained=pretrained,
-        )
-        self.model.to(self.device)
+        self.model, self.preprocess = self._load_model(weights_cache_dir)
+        # Inference is read-only, so cast the weights once instead of autocasting every call.
+        self._dtype = torch.float16 if self.device.type == "cuda" else torch.float32
+        self.model.to(device=self.device, dtype=self._dtype)
+        if self.device.type == "cuda":
+            # Batches are permuted from NHWC, i.e. already channels_last in memory; matching the patch
+            # embedding conv weights lets cuDNN skip a layout transform on every forward.
+            self.model.visual.to(memory_format=torch.channels_last)
         self.model.eval()
+        self._visual, self._compiled = self._build_visual(compile_model)
 
         self.feature_dim = self.model.visual.output_dim
+        (
+            self._resize_size,
+            self.image_size,
+            self._upscale_interpolation,
+            mean,
+            std,
+        ) = self._read_preprocess_params()
+        self._mean = torch.tensor(mean, device=self.device).view(1, 3, 1, 1)
+        self._std = torch.tensor(std, device=self.device).view(1, 3, 1, 1)
+        # Pinned uint8 staging buffer + side stream so host->device copies run asynchronously, and a
+        # device-resident float input buffer the normalized batch is written into. Both are reused.
+        self._h2d_stream = torch.cuda.Stream(device=self.device) if self.device.type == "cuda" else None
+        self._pinned: Optional[torch.Tensor] = None
+        self._device_input: Optional[torch.Tensor] = None
+        self._cpu_out: Optional[torch.Tensor] = None
         init_duration = time.perf_counter() - init_start
 
         logger.info("Loaded CLIP %s (%s) for feature extraction on %s", model_name, pretrained, device_name)
@@ -41,28 +83,335 @@ class FeatureExtractor:
             f"{init_duration:.3f}s on device {self.device_description}"
         )
 
-    def _prepare_tensor(self, img: np.ndarray) -> torch.Tensor:
-        pil_img = Image.fromarray(img)
-        tensor = self.preprocess(pil_img).unsqueeze(0).to(self.device)
-        return tensor
+    @contextlib.contextmanager
+    def reserve_cpu_threads(self, count: int):
+        """
+        Shrink torch's intra-op pool by `count` threads while CPU inference runs next to other
+        CPU-bound workers (e.g. image decoders), so the two do not oversubscribe the cores.
+        No-op on CUDA.
+        """
+        if self.device.type != "cpu" or count <= 0:
+            yield
+            return
+        previous = torch.get_num_threads()
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        torch.set_num_threads(max(1, min(previous, cpus - count)))
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous)
 
-    def _encode_batch(self, batch: torch.Tensor) -> np.ndarray:
-        autocast_ctx = (
-            torch.autocast(device_type="cuda", enabled=True)
-            if self.device.type == "cuda"
-            else nullcontext()
+    @property
+    def cache_stem(self) -> str:
+        """File-name stem identifying this model/weights pair in on-disk caches."""
+        return f"{self.model_name}-{self.pretrained}".replace("/", "_")
+
+    def _load_model(self, weights_cache_dir: Optional[Path]):
+        """Load CLIP from the safetensors weight cache when present, otherwise from OpenCLIP."""
+        cache_path = None
+        if weights_cache_dir is not None:
+            cache_path = Path(weights_cache_dir) / f"{self.cache_stem}.safetensors"
+            if cache_path.exists():
+                start = time.perf_counter()
+                try:
+                    model, preprocess = self._load_cached_model(cache_path)
+                    logger.info("Loaded CLIP weights from %s in %.3fs", cache_path, time.perf_counter() - start)
+                    return model, preprocess
+                except Exception as exc:
+                    logger.warning("Ignoring unusable CLIP weight cache %s: %s", cache_path, exc)
+
+        start = time.perf_counter()
+        model, _, preprocess = open_clip.create_model_and_transforms(
+            self.model_name,
+            pretrained=self.pretrained,
+        )
+        logger.info("Loaded pretrained CLIP weights in %.3fs", time.perf_counter() - start)
+        if cache_path is not None:
+            self._write_weights_cache(model, cache_path)
+        return model, preprocess
+
+    def _load_cached_model(self, cache_path: Path):
+        from safetensors.torch import load_model
+
+        # Build the bare architecture with the same options the pretrained tag would apply.
+        pretrained_cfg = open_clip.get_pretrained_cfg(self.model_name, self.pretrained) or {}
+        model, _, preprocess = open_clip.create_model_and_transforms(
+            self.model_name,
+            pretrained=None,
+            force_quick_gelu=pretrained_cfg.get("quick_gelu", False),
+            image_mean=pretrained_cfg.get("mean"),
+            image_std=pretrained_cfg.get("std"),
         )
-        with torch.no_grad(), autocast_ctx:
-            embeddings = self.model.encode_image(batch)
-        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
-        return embeddings.cpu().numpy()
+        load_model(model, str(cache_path))
+        return model, preprocess
+
+    @staticmethod
+    def _write_weights_cache(model: torch.nn.Module, cache_path: Path) -> None:
+        try:
+            from safetensors.torch import save_model
+        except ImportError:
+            logger.info("safetensors is not installed; skipping CLIP weight cache.")
+            return
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp")
+            save_model(model, str(tmp_path))
+            tmp_path.replace(cache_path)
+            logger.info("Cached CLIP weights to %s", cache_path)
+        except Exception as exc:
+            logger.warning("Failed to cache CLIP weights to %s: %s", cache_path, exc)
+
+    def _build_visual(self, compile_model: bool):
+        """Return the callable used for inference and whether it was compiled."""
+        # torch.compile is only reliable on CUDA; CPU/MPS stay on the eager module.
+        if not compile_model or self.device.type != "cuda":
+            return self.model.visual, False
+        try:
+            return torch.compile(self.model.visual, mode="reduce-overhead", dynamic=False), True
+        except Exception as exc:
+            logger.warning("torch.compile unavailable, using eager CLIP visual tower: %s", exc)
+            return self.model.visual, False
+
+    @staticmethod
+    def _bucket_size(batch_size: int) -> int:
+        for bucket in BATCH_BUCKETS:
+            if batch_size <= bucket:
+                return bucket
+        return batch_size
+
+    def _run_visual(self, batch: torch.Tensor) -> torch.Tensor:
+        if not self._compiled:
+            return self._visual(batch)
+        count = batch.shape[0]
+        padded_size = self._bucket_size(count)
+        if padded_size != count:
+            padding = batch.new_zeros((padded_size - count, *batch.shape[1:]))
+            batch = torch.cat([batch, padding], dim=0)
+        try:
+            return self._visual(batch)[:count]
+        except Exception as exc:
+            logger.warning("Compiled CLIP visual tower failed, falling back to eager mode: %s", exc)
+            self._visual, self._compiled = self.model.visual, False
+            return self._visual(batch[:count])
+
+    def _read_preprocess_params(self) -> Tuple[int, int, int, Tuple[float, ...], Tuple[float, ...]]:
+        """
+        Pull the resize/crop sizes, interpolation, and normalization constants out of the OpenCLIP transform.
+        """
+        resize_size = crop_size = None
+        interpolation = cv2.INTER_CUBIC
+        mean = std = None
+        for transform in self.preprocess.transforms:
+            if isinstance(transform, T.Resize):
+                size = transform.size
+                resize_size = size if isinstance(size, int) else min(size)
+                interpolation = _CV2_INTERPOLATION.get(transform.interpolation, cv2.INTER_CUBIC)
+            elif isinstance(transform, T.CenterCrop):
+                crop_size = transform.size[0]
+            elif isinstance(transform, T.Normalize):
+                mean, std = tuple(transform.mean), tuple(transform.std)
+        if resize_size is None or mean is None or std is None:
+            raise ValueError("Unsupported preprocess pipeline: expected Resize/CenterCrop/Normalize transforms.")
+        return resize_size, crop_size or resize_size, interpolation, mean, std
+
+    def _crop_region(self, h: int, w: int) -> Tuple[int, int, int, int, float]:
+        """Source (top, left, height, width) that survives the shortest-side resize + center crop, and the scale."""
+        size = self.image_size
+        scale = self._resize_size / min(h, w)
+        crop_h = min(h, max(1, round(size / scale)))
+        crop_w = min(w, max(1, round(size / scale)))
+        return (h - crop_h) // 2, (w - crop_w) // 2, crop_h, crop_w, scale
+
+    def _resize_and_crop(self, img: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Resize the shortest side to the transform's resize size and center-crop (HWC uint8).
+
+        Only the source region that survives the crop is resized, straight to the model input size,
+        and the result is written into `dst` when given.
+        """
+        size = self.image_size
+        if dst is None:
+            dst = np.empty((size, size, 3), dtype=np.uint8)
+        top, left, crop_h, crop_w, scale = self._crop_region(*img.shape[:2])
+        roi = img[top : top + crop_h, left : left + crop_w]
+        if roi.shape[:2] == (size, size):
+            dst[...] = roi
+        else:
+            # INTER_AREA approximates the antialiased downscale used by torchvision.
+            interpolation = cv2.INTER_AREA if scale < 1 else self._upscale_interpolation
+            cv2.resize(roi, (size, size), dst=dst, interpolation=interpolation)
+        return dst
+
+    def _prepare_batch(self, images: Sequence[Union[np.ndarray, torch.Tensor]], bgr: bool = False) -> torch.Tensor:
+        """
+        Resize images into one NHWC uint8 array, move it once, and normalize on-device.
+
+        Arrays are RGB unless `bgr` is set (OpenCV's native layout); the channel swap then happens on
+        the model-sized crops instead of on every full-resolution input.
+        """
+        if all(isinstance(img, torch.Tensor) for img in images):
+            return self._prepare_tensor_batch(images)
+        if not all(img.dtype == np.uint8 and img.ndim == 3 and img.shape[2] == 3 for img in images):
+            if bgr:
+                images = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) if np.ndim(img) == 3 else img for img in images]
+            return self._prepare_batch_pil(images)
+        size = self.image_size
+        count = len(images)
+        staging = self._staging_buffer(count)
+        # On CUDA, OpenCV writes straight into the pinned buffer, so there is no intermediate host copy.
+        arr = staging.numpy() if staging is not None else np.empty((count, size, size, 3), dtype=np.uint8)
+        for img, row in zip(images, arr):
+            self._resize_and_crop(img, dst=row)
+        if staging is None:
+            pixels = torch.from_numpy(arr).permute(0, 3, 1, 2)
+            if bgr:
+                pixels = pixels.flip(1)
+            batch = pixels.float().div_(255)
+        else:
+            pixels = self._to_device(staging).permute(0, 3, 1, 2)
+            if bgr:
+                pixels = pixels.flip(1)
+            batch = torch.div(pixels, 255, out=self._input_buffer(count))
+        return batch.sub_(self._mean).div_(self._std)
+
+    def _prepare_tensor_batch(self, images: Sequence[torch.Tensor]) -> torch.Tensor:
+        """Resize/crop/normalize CHW uint8 RGB tensors (e.g. nvJPEG output) where they already live."""
+        size = self.image_size
+        crops = []
+        for img in images:
+            img = img.to(self.device)
+            top, left, crop_h, crop_w, scale = self._crop_region(*img.shape[-2:])
+            roi = img[None, :, top : top + crop_h, left : left + crop_w].float()
+            if roi.shape[-2:] != (size, size):
+                downscale = scale < 1
+                roi = F.interpolate(
+                    roi,
+                    size=(size, size),
+                    mode="bilinear" if downscale else "bicubic",
+                    antialias=downscale,
+                    align_corners=False,
+                ).clamp_(0, 255)
+            crops.append(roi)
+        batch = torch.cat(crops).div_(255)
+        return batch.sub_(self._mean).div_(self._std)
+
+    def _staging_buffer(self, count: int) -> Optional[torch.Tensor]:
+        """Pinned NHWC uint8 slice for `count` images (CUDA only), safe to overwrite."""
+        if self._h2d_stream is None:
+            return None
+        size = self.image_size
+        if self._pinned is None or self._pinned.shape[0] < count:
+            capacity = max(count, BATCH_BUCKETS[-1])
+            self._pinned = torch.empty((capacity, size, size, 3), dtype=torch.uint8, pin_memory=True)
+        # The previous async copy must finish reading the staging buffer before it is overwritten.
+        self._h2d_stream.synchronize()
+        return self._pinned[:count]
+
+    def _input_buffer(self, count: int) -> torch.Tensor:
+        """Reusable (count, 3, S, S) float32 device tensor; channels_last to match the NHWC staging layout."""
+        if self._device_input is None or self._device_input.shape[0] < count:
+            capacity = max(count, BATCH_BUCKETS[-1])
+            size = self.image_size
+            self._device_input = torch.empty(
+                (capacity, 3, size, size),
+                device=self.device,
+                memory_format=torch.channels_last,
+            )
+        return self._device_input[:count]
+
+    def _to_device(self, staging: torch.Tensor) -> torch.Tensor:
+        """Start an async copy of a pinned staging slice onto the device, ordered before current-stream work."""
+        with torch.cuda.stream(self._h2d_stream):
+            device_batch = staging.to(self.device, non_blocking=True)
+        current = torch.cuda.current_stream(self.device)
+        current.wait_stream(self._h2d_stream)
+        device_batch.record_stream(current)
+        return device_batch
+
+    def _prepare_batch_pil(self, images: Sequence[np.ndarray]) -> torch.Tensor:
+        """Reference OpenCLIP preprocessing for grayscale/RGBA/non-uint8 inputs."""
+        from PIL import Image
+
+        tensors = [self.preprocess(Image.fromarray(np.asarray(img))) for img in images]
+        return torch.stack(tensors).to(self.device)
+
+    def _embed(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            embeddings = self._run_visual(batch.to(self._dtype))
+        # Normalize in FP32; the squared-sum is too lossy in half precision.
+        return F.normalize(embeddings.float(), dim=-1)
+
+    def _to_host(self, embeddings: torch.Tensor) -> np.ndarray:
+        if embeddings.device.type != "cuda":
+            return embeddings.cpu().numpy()
+        count = embeddings.shape[0]
+        if self._cpu_out is None or self._cpu_out.shape[0] < count or self._cpu_out.shape[1:] != embeddings.shape[1:]:
+            capacity = max(count, BATCH_BUCKETS[-1])
+            self._cpu_out = torch.empty((capacity, *embeddings.shape[1:]), dtype=embeddings.dtype, pin_memory=True)
+        host = self._cpu_out[:count]
+        host.copy_(embeddings, non_blocking=True)
+        torch.cuda.current_stream(embeddings.device).synchronize()
+        # The pinned buffer is reused by the next call, so hand back an owned copy.
+        return host.numpy().copy()
+
+    def _encode_batch(self, batch: torch.Tensor) -> np.ndarray:
+        return self._to_host(self._embed(batch))
 
     def extract_features(self, img: np.ndarray) -> np.ndarray:
         return self.extract_features_batch([img])[0]
 
-    def extract_features_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+    def extract_features_batch(
+        self,
+        images: Sequence[np.ndarray],
+        out: Optional[np.ndarray] = None,
+        *,
+        bgr: bool = False,
+    ) -> np.ndarray:
+        """
+        Embed `images` and return an (N, D) float32 matrix. When `out` is given, rows are written
+        into `out[:N]` (which must be C-contiguous float32) and that view is returned. Set `bgr` for
+        images still in OpenCV's BGR channel order.
+        """
         if not images:
             raise ValueError("At least one image is required for feature extraction.")
-        tensors = [self._prepare_tensor(img) for img in images]
-        batch = torch.cat(tensors, dim=0)
-        return self._encode_batch(batch)
+        batch = self._prepare_batch(images, bgr=bgr)
+        if out is None:
+            return self._encode_batch(batch)
+        target = out[: len(images)]
+        torch.from_numpy(target).copy_(self._embed(batch))
+        return target
+
+    def extract_query_ensemble(
+        self,
+        img: np.ndarray,
+        *,
+        horizontal_flip: bool = True,
+        crop_ratio: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Embed a query image together with its flip/center-crop variants in a single forward pass
+        and return the L2-normalized mean embedding.
+        """
+        base = self._prepare_batch([img])
+        variants = [base]
+        if horizontal_flip:
+            variants.append(torch.flip(base, dims=[-1]))
+        if crop_ratio is not None:
+            size = self.image_size
+            crop = max(1, int(size * crop_ratio))
+            offset = (size - crop) // 2
+            cropped = base[..., offset : offset + crop, offset : offset + crop]
+            variants.append(F.interpolate(cropped, size=(size, size), mode="bilinear", align_corners=False))
+        return self._mean_direction(self._embed(torch.cat(variants, dim=0)))
+
+    def extract_query_vector(self, variants: Sequence[np.ndarray]) -> np.ndarray:
+        """Embed caller-provided query variants in one batch and return their L2-normalized mean."""
+        if not variants:
+            raise ValueError("At least one image is required for feature extraction.")
+        return self._mean_direction(self._embed(self._prepare_batch(variants)))
+
+    def _mean_direction(self, embeddings: torch.Tensor) -> np.ndarray:
+        # Reduce on the device so only a single (D,) vector crosses back to the host. The sum has the
+        # same direction as the mean, so the 1/V scale is skipped before normalizing.
+        query = F.normalize(embeddings.sum(dim=0, keepdim=True), dim=-1)
+        return self._to_host(query)[0]
@@ -0,0 +1,120 @@
+import logging
+import time
+from pathlib import Path
+from typing import List
+
+import torch
+
+from .feature_extractor import FeatureExtractor
+
+logger = logging.getLogger(__name__)
+
+ONNX_OPSET_VERSION = 17
+
+
+class OnnxFeatureExtractor(FeatureExtractor):
+    """CLIP feature extractor that runs the visual tower through ONNX Runtime."""
+
+    def __init__(
+        self,
+        model_name: str = "ViT-B-32",
+        pretrained: str = "openai",
+        *,
+        force_cpu: bool = False,
+        cache_dir: Path = Path("data/models"),
+        quantize_int8: bool = False,
+    ):
+        import onnxruntime as ort
+
+        super().__init__(
+            model_name,
+            pretrained,
+            force_cpu=force_cpu,
+            compile_model=False,
+            weights_cache_dir=cache_dir,
+        )
+
+        start = time.perf_counter()
+        model_path = self._ensure_onnx_model(Path(cache_dir), quantize_int8=quantize_int8)
+        options = ort.SessionOptions()
+        options.enable_cpu_mem_arena = True
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=self._select_providers(ort.get_available_providers()),
+        )
+        self._input_name = self._session.get_inputs()[0].name
+        # The exported graph is FP32 and ONNX Runtime owns inference from here, so feed it FP32 inputs
+        # and release the torch model instead of keeping a second copy of the weights resident.
+        self._dtype = torch.float32
+        self.model = None
+        self._visual = None
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+        self.device_description = f"{self.device_description} (ONNX Runtime {self._session.get_providers()[0]})"
+        print(f"[Startup] ONNX Runtime session ready in {time.perf_counter() - start:.3f}s from {model_path}")
+
+    def _select_providers(self, available: List[str]) -> List[str]:
+        preferred = ["CPUExecutionProvider"]
+        if self.device.type == "cuda":
+            preferred.insert(0, "CUDAExecutionProvider")
+        else:
+            preferred.insert(0, "OpenVINOExecutionProvider")
+        return [provider for provider in preferred if provider in available] or available
+
+    def _ensure_onnx_model(self, cache_dir: Path, *, quantize_int8: bool) -> Path:
+        stem = self.cache_stem
+        fp32_path = cache_dir / f"{stem}.onnx"
+        if not fp32_path.exists():
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            logger.info("Exporting CLIP visual tower to %s", fp32_path)
+            # The torch model is dropped once the session exists, so convert it in place rather than copying.
+            visual = self.model.visual.float().cpu().eval()
+            dummy = torch.randn(1, 3, self.image_size, self.image_size)
+            torch.onnx.export(
+                visual,
+                (dummy,),
+                str(fp32_path),
+                input_names=["input"],
+                output_names=["embeddings"],
+                dynamic_axes={"input": {0: "batch"}, "embeddings": {0: "batch"}},
+                opset_version=ONNX_OPSET_VERSION,
+            )
+        if not quantize_int8:
+            return fp32_path
+
+        int8_path = cache_dir / f"{stem}.int8.onnx"
+        if not int8_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info("Quantizing ONNX MatMul weights to int8 at %s", int8_path)
+            quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _run_visual(self, batch: torch.Tensor) -> torch.Tensor:
+        inputs = batch.detach().float().cpu().numpy()
+        (embeddings,) = self._session.run(None, {self._input_name: inputs})
+        return torch.from_numpy(embeddings)
+
+
+def create_feature_extractor(config) -> FeatureExtractor:
+    """Build the configured feature extractor, falling back to PyTorch when ONNX Runtime is missing."""
+    if config.feature_backend == "onnx":
+        try:
+            return OnnxFeatureExtractor(
+                model_name=config.feature_model_name,
+                pretrained=config.feature_model_pretrained,
+                force_cpu=config.force_cpu,
+                cache_dir=config.model_cache_dir,
+                quantize_int8=config.onnx_quantize_int8,
+            )
+        except ImportError:
+            logger.warning("onnxruntime is not installed; using the PyTorch feature extractor.")
+    return FeatureExtractor(
+        model_name=config.feature_model_name,
+        pretrained=config.feature_model_pretrained,
+        force_cpu=config.force_cpu,
+        compile_model=config.feature_compile_model,
+        weights_cache_dir=config.model_cache_dir,
+    )
@@ -5,6 +5,14 @@ from functools import lru_cache
 
 import torch
 
+__all__ = [
+    "DeviceStatus",
+    "bannerize_gpu_status",
+    "detect_gpu",
+    "get_device_name",
+    "resolve_torch_device",
+]
+
 
 @dataclass(frozen=True)
 class DeviceStatus:
@@ -17,7 +25,7 @@ class DeviceStatus:
 
 
 def _detect_device() -> DeviceStatus:
-    """Resolve the preferred torch.device and memoize the result."""
+    """Resolve the preferred torch.device. Call through `_device_status` so probing happens once."""
     if torch.cuda.is_available():
         name = torch.cuda.get_device_name(0)
         return DeviceStatus(
@@ -1,13 +1,16 @@
+import asyncio
+import contextlib
 import logging
 import time
 from fastapi import FastAPI, File, Form, HTTPException, Query, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from typing import List, Optional
 
-from .feature_extractor import FeatureExtractor
+from .feature_extractor_onnx import create_feature_extractor
 from .models import (
     AddProductResponse,
     CatalogPage,
@@ -17,7 +20,7 @@ from .models import (
     SearchResult,
 )
 from .gpu_utils import bannerize_gpu_status
-from .config import app_config
+from .config import get_settings
 from .services.catalog_service import CatalogService
 from .utils.upload_utils import (
     build_query_features,
@@ -31,6 +34,13 @@ from .utils.upload_utils import (
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson  # noqa: F401  (required by ORJSONResponse)
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+app_config = get_settings()
 SUPPORTED_FORMATS_MESSAGE = build_supported_formats_message(app_config)
 TOTAL_MATCHES_HEADER = "X-Total-Matches"
 
@@ -50,7 +60,7 @@ SEARCH_SUCCESS_RESPONSE = {
     }
 }
 
-app = FastAPI(title="Visual Search API", version="1.0.0")
+app = FastAPI(title="Visual Search API", version="1.0.0", default_response_class=FastJSONResponse)
 static_files_app = StaticFiles(directory="data")
 app.mount("/data", static_files_app, name="data")
 APP_BOOT_TIMER = time.perf_counter()
@@ -91,14 +101,6 @@ async def get_asset(requested_path: str):
 _, gpu_banner = bannerize_gpu_status()
 logger.info(gpu_banner)
 
-# Initialize services
-feature_extractor = FeatureExtractor(
-    model_name=app_config.feature_model_name,
-    pretrained=app_config.feature_model_pretrained,
-    force_cpu=app_config.force_cpu,
-)
-catalog_service = CatalogService(feature_extractor, app_config)
-
 
 def _normalize_client_image_path(image_path: str) -> str:
     path_obj = Path(image_path)
@@ -116,11 +118,28 @@ def _normalize_product_for_client(product: Product) -> dict:
     data["image_path"] = _normalize_client_image_path(data["image_path"])
     return data
 
+
+# Initialize services
+feature_extractor = create_feature_extractor(app_config)
+catalog_service = CatalogService(feature_extractor, app_config, product_serializer=_normalize_product_for_client)
+index_saver_task: Optional[asyncio.Task] = None
+search_batcher_task: Optional[asyncio.Task] = None
+# Search uploads can stay on the GPU end to end; catalog uploads are written to disk, so they decode on the CPU.
+QUERY_DECODE_DEVICE = (
+    feature_extractor.device
+    if app_config.gpu_decode_enabled and feature_extractor.device.type == "cuda"
+    else None
+)
+
+
 # Load catalog on startup
 @app.on_event("startup")
 async def startup_event():
     """Load existing catalog and build index"""
+    global index_saver_task, search_batcher_task
     startup_metrics = catalog_service.startup()
+    index_saver_task = asyncio.create_task(catalog_service.run_index_saver())
+    search_batcher_task = asyncio.create_task(catalog_service.run_search_batcher())
     total_boot = time.perf_counter() - APP_BOOT_TIMER
     print(
         "[Startup] Catalog ready in "
@@ -134,11 +153,25 @@ async def startup_event():
         f"CLIP={feature_extractor.device_description}, FAISS={faiss_device}"
     )
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background tasks, answering queued searches and flushing any pending save."""
+    for task in (search_batcher_task, index_saver_task):
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
 @app.get("/")
 async def root():
     return {"message": "Visual Search API", "status": "running"}
 
-@app.post("/search", response_model=List[SearchResult], responses=SEARCH_SUCCESS_RESPONSE)
+@app.post(
+    "/search",
+    response_model=None,
+    responses={200: {**SEARCH_SUCCESS_RESPONSE[200], "model": List[SearchResult]}},
+)
 async def search_similar(
     file: UploadFile = File(...),
     top_k: int = Form(app_config.search_default_top_k),
@@ -152,24 +185,26 @@ async def search_similar(
     status_label = "failed"
     try:
         validate_upload_file(file, app_config)
-        image = await decode_upload_image(file, failure_detail=SUPPORTED_FORMATS_MESSAGE, failure_status=415)
-        query_features = build_query_features(image, feature_extractor, app_config)
+        image = await decode_upload_image(
+            file,
+            failure_detail=SUPPORTED_FORMATS_MESSAGE,
+            failure_status=415,
+            gpu_device=QUERY_DECODE_DEVICE,
+        )
+        # The CLIP forward pass blocks for milliseconds; keep it off the loop so queued searches keep moving.
+        query_features = await run_in_threadpool(build_query_features, image, feature_extractor, app_config)
 
         requested_top_k = parse_positive_int(top_k, param_name="top_k")
         similarity_threshold = parse_similarity_threshold(min_similarity)
 
-        results, total_matches = catalog_service.search(query_features, similarity_threshold, requested_top_k)
-        payload = [
-            {
-                "product": _normalize_product_for_client(result.product),
-                "similarity_score": result.similarity_score,
-            }
-            for result in results
-        ]
+        # Results are already client-shaped dicts; skipping the response model avoids re-validating them.
+        payload, total_matches = await catalog_service.search_batched(
+            query_features, similarity_threshold, requested_top_k
+        )
         result_count = len(payload)
         headers = {TOTAL_MATCHES_HEADER: str(total_matches)}
         status_label = "succeeded"
-        return JSONResponse(content=payload, headers=headers)
+        return FastJSONResponse(content=payload, headers=headers)
     
     except HTTPException:
         raise
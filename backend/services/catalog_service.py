@@ -1,16 +1,20 @@
+import asyncio
+import json
 import logging
 import math
+import os
+import threading
 import time
 from pathlib import Path
-from typing import Optional, Tuple, List, Set, Union, Dict
+from typing import Callable, Optional, Tuple, List, Set, Union, Dict
 
-import cv2
 import numpy as np
 
 from ..config import AppConfig
 from ..feature_extractor import FeatureExtractor
 from ..models import CatalogPage, CatalogStats, Product
 from ..similarity_search import SimilaritySearchEngine
+from ..utils.image_codecs import encode_jpeg_rgb
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +22,39 @@ logger = logging.getLogger(__name__)
 class CatalogService:
     """Encapsulates catalog indexing, search, and persistence logic."""
 
-    def __init__(self, feature_extractor: FeatureExtractor, config: AppConfig):
+    def __init__(
+        self,
+        feature_extractor: FeatureExtractor,
+        config: AppConfig,
+        product_serializer: Optional[Callable[[Product], dict]] = None,
+    ):
         self.feature_extractor = feature_extractor
         self.config = config
+        self.product_serializer = product_serializer
         self.search_engine = self._create_search_engine()
+        # Serializes index mutations against the snapshot a background save takes; held only for
+        # that in-memory copy, never for disk I/O, since mutations wait for it on the event loop.
+        self._index_lock = threading.Lock()
+        # One cache writer at a time (the saver thread and the final flush on shutdown).
+        self._save_lock = threading.Lock()
+        self._save_pending: Optional[asyncio.Event] = None
+        # (query, top_k, threshold, future) entries waiting for the search batcher.
+        self._search_queue: Optional[asyncio.Queue] = None
 
     def _create_search_engine(self) -> SimilaritySearchEngine:
-        return SimilaritySearchEngine(feature_dim=self.feature_extractor.feature_dim)
+        return SimilaritySearchEngine(
+            feature_dim=self.feature_extractor.feature_dim,
+            quantize_int8=self.config.index_quantize_int8,
+            binary_prefilter=self.config.index_binary_prefilter,
+            rerank_oversample=self.config.search_rerank_oversample,
+            store_fp16=self.config.index_store_fp16,
+            store_int8=self.config.index_store_int8,
+            ivfpq_min_size=self.config.index_ivfpq_min_size,
+            nprobe=self.config.search_nprobe,
+            exact_scan_max_size=self.config.search_exact_scan_max_size,
+            use_gpu=self.config.index_use_gpu,
+            product_serializer=self.product_serializer,
+        )
 
     # ------------------------------------------------------------------ #
     # Lifecycle / Index Management
@@ -42,39 +72,80 @@ class CatalogService:
             "duration_seconds": duration,
             "catalog_size": self.search_engine.get_catalog_size(),
         }
+
     def _cache_index_to_disk(self) -> None:
-        if self.config.cache_index_on_startup and self.search_engine.get_catalog_size() > 0:
-            self.search_engine.save_index(str(self.config.index_base_path))
+        if not self.config.cache_index_on_startup:
+            return
+        with self._save_lock:
+            with self._index_lock:
+                engine = self.search_engine
+                if engine.get_catalog_size() == 0:
+                    return
+                snapshot = engine.snapshot()
+            engine.write_snapshot(snapshot, str(self.config.index_base_path))
+            self._write_catalog_fingerprint(snapshot.products)
             logger.info("Cached catalog index to disk.")
 
+    def _request_index_save(self) -> None:
+        """Queue a save for the background saver, or save inline when no saver is running."""
+        if self._save_pending is None:
+            self._cache_index_to_disk()
+        else:
+            self._save_pending.set()
+
+    async def run_index_saver(self) -> None:
+        """
+        Persist the index off the request path. Mutations within the debounce window are coalesced
+        into one save; a pending save is flushed when the task is cancelled.
+        """
+        self._save_pending = asyncio.Event()
+        try:
+            while True:
+                await self._save_pending.wait()
+                await asyncio.sleep(self.config.index_save_debounce_seconds)
+                self._save_pending.clear()
+                await asyncio.to_thread(self._cache_index_to_disk)
+        finally:
+            pending = self._save_pending.is_set()
+            self._save_pending = None
+            if pending:
+                self._cache_index_to_disk()
+
     def _rebuild_index_from_disk(self) -> None:
         logger.info("Building catalog index from images...")
         self.search_engine = self._create_search_engine()
-        self.search_engine.build_index_from_directory(
-            self.config.catalog_dir,
-            self.feature_extractor,
-            batch_size=self.config.index_build_batch_size,
-            max_workers=self.config.index_build_workers,
-        )
+        # The decode workers run alongside CPU inference; keep them from competing for the same cores.
+        with self.feature_extractor.reserve_cpu_threads(self.config.index_build_workers):
+            self.search_engine.build_index_from_directory(
+                self.config.catalog_dir,
+                self.feature_extractor,
+                batch_size=self.config.index_build_batch_size,
+                max_workers=self.config.index_build_workers,
+            )
         logger.info("Loaded %s products", self.search_engine.get_catalog_size())
         self._cache_index_to_disk()
 
     def _load_cached_index_if_valid(self) -> bool:
         index_base = self.config.index_base_path
-        index_files_exist = index_base.with_suffix(".index").exists() and index_base.with_suffix(".pkl").exists()
-        if not index_files_exist:
+        if not SimilaritySearchEngine.has_cached_index(str(index_base)):
             return False
         try:
             logger.info("Loading precomputed catalog index...")
             self.search_engine.load_index(str(index_base))
+            if self.search_engine.index.d != self.feature_extractor.feature_dim:
+                logger.warning("Cached index dimension mismatch with current feature extractor.")
+                return False
+            if self._catalog_fingerprint_matches():
+                logger.info(
+                    "Loaded %s products from cache (catalog directory unchanged)",
+                    self.search_engine.get_catalog_size(),
+                )
+                return True
             missing = [
                 product
                 for product in self.search_engine.products
                 if not Path(product.image_path).exists()
             ]
-            if self.search_engine.index.d != self.feature_extractor.feature_dim:
-                logger.warning("Cached index dimension mismatch with current feature extractor.")
-                return False
             if missing:
                 logger.warning("Detected %s missing image files. Cached index invalid.", len(missing))
                 return False
@@ -95,17 +166,85 @@ class CatalogService:
         query_features: np.ndarray,
         similarity_threshold: float,
         requested_top_k: int,
-    ) -> Tuple[List, int]:
+    ) -> Tuple[List[dict], int]:
+        """Return the serialized top results and the total number of matches above the threshold."""
         limit = max(1, requested_top_k)
-        results = self.search_engine.search(query_features, top_k=limit)
-        if similarity_threshold > 0:
-            results = [
-                result
-                for result in results
-                if result.similarity_score >= similarity_threshold
-            ]
-        total_matches = self.search_engine.count_matches(query_features, similarity_threshold)
-        return results, total_matches
+        return self.search_engine.search_payload_with_count(
+            query_features,
+            top_k=limit,
+            min_similarity=similarity_threshold,
+        )
+
+    async def search_batched(
+        self,
+        query_features: np.ndarray,
+        similarity_threshold: float,
+        requested_top_k: int,
+    ) -> Tuple[List[dict], int]:
+        """`search`, coalesced with concurrent requests when the search batcher is running."""
+        if self._search_queue is None:
+            return self.search(query_features, similarity_threshold, requested_top_k)
+        future = asyncio.get_running_loop().create_future()
+        self._search_queue.put_nowait((query_features, max(1, requested_top_k), similarity_threshold, future))
+        return await future
+
+    async def run_search_batcher(self) -> None:
+        """
+        Score queued searches together: after the first query arrives, wait up to
+        `search_batch_window_ms` for more (at most `search_batch_max_size`), then answer them all
+        from one batched engine call. Scoring runs in a worker thread so the event loop keeps accepting
+        requests meanwhile. Queued searches are still answered when the task is cancelled.
+        """
+        if self.config.search_batch_window_ms <= 0:
+            return
+        window = self.config.search_batch_window_ms / 1000
+        loop = asyncio.get_running_loop()
+        self._search_queue = asyncio.Queue()
+        batch: List[tuple] = []
+        try:
+            while True:
+                batch = [await self._search_queue.get()]
+                deadline = loop.time() + window
+                while len(batch) < self.config.search_batch_max_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._search_queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                await self._run_search_batch(batch)
+        finally:
+            queue = self._search_queue
+            self._search_queue = None
+            # A batch interrupted mid-scoring is answered again along with whatever is still queued.
+            pending = list(batch)
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+            await self._run_search_batch(pending)
+
+    async def _run_search_batch(self, batch: List[tuple]) -> None:
+        batch = [entry for entry in batch if not entry[3].done()]
+        if not batch:
+            return
+        futures = [entry[3] for entry in batch]
+        try:
+            results = await asyncio.to_thread(self._score_search_batch, batch)
+        except Exception as exc:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _score_search_batch(self, batch: List[tuple]) -> List[Tuple[List[dict], int]]:
+        queries, top_ks, thresholds, _ = zip(*batch)
+        stacked = np.stack([np.reshape(query, -1) for query in queries])
+        # Held so scoring in the worker thread never sees an add or delete halfway through.
+        with self._index_lock:
+            return self.search_engine.search_payload_batch_with_count(stacked, top_ks, thresholds)
 
     def add_product(
         self,
@@ -122,8 +261,9 @@ class CatalogService:
             name=name or product_id,
             image_path=image_path.as_posix(),
         )
-        self.search_engine.add_product(product, features, position="front")
-        self._cache_index_to_disk()
+        with self._index_lock:
+            self.search_engine.add_product(product, features, position="front")
+        self._request_index_save()
         return product
 
     def delete_product(self, product_id: str) -> Product:
@@ -135,10 +275,11 @@ class CatalogService:
         if image_path.exists():
             image_path.unlink()
 
-        removed = self.search_engine.remove_product(product_id)
+        with self._index_lock:
+            removed = self.search_engine.remove_product(product_id)
         if not removed:
             raise ValueError("Product not found.")
-        self._cache_index_to_disk()
+        self._request_index_save()
         return product
 
     def get_all_products(self) -> List[Product]:
@@ -209,11 +350,54 @@ class CatalogService:
             return False
         return True
 
+    @property
+    def _fingerprint_path(self) -> Path:
+        return self.config.index_base_path.with_suffix(".fingerprint.json")
+
+    def _write_catalog_fingerprint(self, products: List[Product]) -> None:
+        """
+        Record the catalog directory's mtime when the saved index covers exactly its image files.
+
+        Adding, removing or renaming an entry bumps the directory mtime, so a matching mtime at the
+        next startup proves the cache is current with one stat() instead of one per image. Rewriting an
+        existing image in place under the same name does not touch the directory and is not detected;
+        delete the cached index (or re-add the image through the API) after editing files that way.
+        """
+        fingerprint_path = self._fingerprint_path
+        catalog_dir = self.config.catalog_dir
+        supported = set(self.config.supported_image_formats)
+        # Taken before the scan: an upload landing after it changes the mtime and voids the fingerprint.
+        mtime_ns = catalog_dir.stat().st_mtime_ns
+        with os.scandir(catalog_dir) as entries:
+            disk_names = {
+                entry.name
+                for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in supported
+            }
+        indexed_names = {Path(product.image_path).name for product in products}
+        if len(indexed_names) != len(products) or indexed_names != disk_names:
+            fingerprint_path.unlink(missing_ok=True)
+            return
+        fingerprint = {"mtime_ns": mtime_ns, "count": len(products)}
+        fingerprint_path.write_text(json.dumps(fingerprint), encoding="utf-8")
+
+    def _catalog_fingerprint_matches(self) -> bool:
+        try:
+            fingerprint = json.loads(self._fingerprint_path.read_text(encoding="utf-8"))
+            mtime_ns = self.config.catalog_dir.stat().st_mtime_ns
+        except (OSError, ValueError):
+            return False
+        return (
+            fingerprint.get("mtime_ns") == mtime_ns
+            and fingerprint.get("count") == self.search_engine.get_catalog_size()
+        )
+
     def _save_catalog_image(self, image: np.ndarray, product_id: str) -> Path:
         catalog_dir = self.config.catalog_dir
         catalog_dir.mkdir(parents=True, exist_ok=True)
         image_path = catalog_dir / f"{product_id}.jpg"
-        cv2.imwrite(str(image_path), cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+        # libjpeg-turbo takes RGB directly, so no BGR copy is needed on that path.
+        image_path.write_bytes(encode_jpeg_rgb(image))
         return image_path
 
     def _resolve_product_id(self, provided_id: Optional[str]) -> str:
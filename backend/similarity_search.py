@@ -1,44 +1,419 @@
+import json
 import logging
+import os
 import pickle
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
 
-import cv2
 import faiss
 import numpy as np
 
+from . import _scoring
 from .models import Product, SearchResult
+from .utils.image_codecs import decode_image_bgr, decode_jpeg_bgr
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff", ".tif", ".webp"}
+JPEG_MAGIC = b"\xff\xd8\xff"
+# Memory-maps the codes of flat/SQ8 indexes on read (FAISS >= 1.10); None on older builds.
+_MMAP_INDEX_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+# Per-thread (1, D) buffer the query is normalized into on the search and count paths.
+_QUERY_SCRATCH = threading.local()
 logger = logging.getLogger(__name__)
 
 
+def _faiss_simd_level() -> str:
+    """SIMD level of the loaded FAISS kernels, e.g. "AVX2" ("generic" for a scalar build)."""
+    simd_config = getattr(faiss, "SIMDConfig", None)
+    if simd_config is not None:
+        # Dynamic-dispatch builds pick the level at runtime.
+        return simd_config.get_level_name()
+    # Older wheels load one of several prebuilt libraries (generic/AVX2/AVX512) and report it here.
+    options = faiss.get_compile_options().split()
+    for level in ("AVX512", "AVX2", "NEON", "SVE"):
+        if level in options:
+            return level
+    return "generic"
+
+
+FAISS_SIMD_LEVEL = _faiss_simd_level()
+if FAISS_SIMD_LEVEL == "generic":
+    logger.warning(
+        "FAISS was loaded without SIMD kernels; install an AVX2/AVX512 faiss-cpu wheel (or an aarch64 "
+        "NEON build) for several times faster inner-product scans."
+    )
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Owned copy of a search engine's persistent state, as taken by `SimilaritySearchEngine.snapshot`."""
+
+    index_bytes: np.ndarray
+    binary_index_bytes: Optional[np.ndarray]
+    matrix: np.ndarray
+    row_scales: Optional[np.ndarray]
+    products: List[Product]
+    row_product_ids: List[str]
+    row_faiss_ids: np.ndarray
+    next_faiss_id: int
+    feature_dim: int
+    index_kind: str
+
+
 class SimilaritySearchEngine:
     _COSINE_MIN = -1.0
     _COSINE_MAX = 1.0
 
-    def __init__(self, feature_dim: int = 512):
+    # Below this many vectors the per-dimension int8 ranges are taken as the full unit-vector
+    # range instead of being fitted to a handful of samples.
+    _MIN_QUANTIZER_TRAINING_SIZE = 256
+    # Flat catalogs below this size are scanned directly; the (N, D) matrix stays cache-resident and
+    # skipping the FAISS call overhead wins.
+    _EXACT_SCAN_MAX_SIZE = 10_000
+    _MIN_MATRIX_CAPACITY = 64
+    # Vectors sampled to train the IVF coarse quantizer and PQ codebooks.
+    _IVFPQ_TRAINING_SAMPLE = 50_000
+
+    def __init__(
+        self,
+        feature_dim: int = 512,
+        *,
+        quantize_int8: bool = False,
+        binary_prefilter: bool = False,
+        rerank_oversample: int = 4,
+        store_fp16: bool = False,
+        store_int8: bool = False,
+        ivfpq_min_size: Optional[int] = None,
+        nprobe: int = 16,
+        exact_scan_max_size: int = _EXACT_SCAN_MAX_SIZE,
+        use_gpu: bool = False,
+        product_serializer: Optional[Callable[[Product], dict]] = None,
+    ):
         """
-        Initialize FAISS index for similarity search
+        Initialize FAISS index for similarity search.
+
+        With `quantize_int8` the FAISS index stores 8-bit scalar-quantized codes; with
+        `binary_prefilter` candidates come from a sign-bit Hamming index instead. Either way the top
+        `rerank_oversample * top_k` candidates are re-scored against the FP32 vectors.
+        `store_fp16` keeps the exact-score matrix in half precision, converting blocks on the fly;
+        `store_int8` (which takes precedence) keeps int8 rows with per-row scales instead.
+        Bulk loads of at least `ivfpq_min_size` vectors into an empty engine switch the FAISS index
+        to IVF-PQ, probing `nprobe` lists per query. Exact flat catalogs smaller than
+        `exact_scan_max_size` are scored by a direct scan of the feature matrix. `use_gpu` searches large flat catalogs with a
+        FAISS GPU index mirrored from the feature matrix (when faiss-gpu and a CUDA device exist).
+        `product_serializer` turns products into the dicts returned by `search_payload`.
         """
         self.feature_dim = feature_dim
-        self.backend_description = "CPU (FAISS IndexFlatIP)"
+        self.quantize_int8 = quantize_int8
+        self.binary_prefilter = binary_prefilter
+        self.rerank_oversample = max(1, rerank_oversample)
+        if store_int8:
+            self.matrix_dtype = np.dtype(np.int8)
+        else:
+            self.matrix_dtype = np.dtype(np.float16 if store_fp16 else np.float32)
+        self.ivfpq_min_size = ivfpq_min_size
+        self.nprobe = nprobe
+        self.exact_scan_max_size = exact_scan_max_size
+        self._gpu_resources = self._create_gpu_resources() if use_gpu else None
+        self._gpu_index: Optional[faiss.Index] = None
+        self._gpu_rows = 0
+        self.product_serializer: Callable[[Product], dict] = product_serializer or Product.model_dump
+        self._product_dicts: Dict[str, dict] = {}
+        # The dimension-major PDX copy only pays off with the JIT counting kernel.
+        self._pdx_enabled = _scoring.NUMBA_AVAILABLE and self.matrix_dtype == np.float32
         self._init_index()
-        self.products: List[Product] = []
-        self.feature_vectors: Dict[str, np.ndarray] = {}
+        self._products: List[Product] = []
+        self._removed_ids: Set[str] = set()
         self.product_lookup: Dict[str, Product] = {}
-        self.product_id_to_faiss_id: Dict[str, int] = {}
-        self.faiss_id_to_product_id: Dict[int, str] = {}
         self.next_faiss_id: int = 0
-        self._feature_matrix_cache: Optional[np.ndarray] = None
+        self._reset_matrix()
         logger.info("Initialized FAISS index with dimension %s", feature_dim)
 
+    @property
+    def products(self) -> List[Product]:
+        """Products in catalog order. Removals are applied lazily, so a run of deletes costs one O(N) pass."""
+        if self._removed_ids:
+            self._products = [product for product in self._products if product.id not in self._removed_ids]
+            self._removed_ids = set()
+        return self._products
+
+    @products.setter
+    def products(self, products: List[Product]):
+        self._products = products
+        self._removed_ids = set()
+
+    @property
+    def index_kind(self) -> str:
+        """Short identifier of the FAISS index layout, persisted alongside cached indexes."""
+        if self.ivfpq_active:
+            return "ivfpq"
+        return "sq8" if self.quantize_int8 else "flat"
+
+    @property
+    def _approximate(self) -> bool:
+        """Whether candidates come from compressed codes and need the exact rerank."""
+        return self.quantize_int8 or self.ivfpq_active or self.binary_index is not None
+
     def _init_index(self):
         # Use cosine similarity via inner product with ID mapping
-        base_index = faiss.IndexFlatIP(self.feature_dim)
+        if self.quantize_int8:
+            base_index = faiss.IndexScalarQuantizer(
+                self.feature_dim,
+                faiss.ScalarQuantizer.QT_8bit,
+                faiss.METRIC_INNER_PRODUCT,
+            )
+        else:
+            base_index = faiss.IndexFlatIP(self.feature_dim)
         cpu_index = faiss.IndexIDMap2(base_index)
         self.index = cpu_index
+        # True while self.index views memory-mapped cache pages and must be copied before it changes.
+        self._index_mapped = False
+        self.ivfpq_active = False
+        self.binary_index: Optional[faiss.IndexBinary] = self._new_binary_index() if self.binary_prefilter else None
+        self._update_backend_description()
+
+    @staticmethod
+    def _create_gpu_resources():
+        if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+            logger.info("FAISS GPU support unavailable; searching on the CPU.")
+            return None
+        return faiss.StandardGpuResources()
+
+    def _use_gpu_search(self) -> bool:
+        return self._gpu_resources is not None and not self._approximate
+
+    def _sync_gpu_index(self):
+        """
+        Mirror the feature matrix into the GPU index. Appended rows are flushed as one batch on the
+        next search; removals reorder rows, so they trigger a full re-upload instead.
+        """
+        if self._gpu_index is None or self._gpu_rows > self._matrix_rows:
+            gpu_config = faiss.GpuIndexFlatConfig()
+            gpu_config.useFloat16 = self.matrix_dtype == np.float16
+            self._gpu_index = faiss.GpuIndexFlatIP(self._gpu_resources, self.feature_dim, gpu_config)
+            self._gpu_rows = 0
+        if self._gpu_rows < self._matrix_rows:
+            self._gpu_index.add(self._float_rows(self._gpu_rows, self._matrix_rows))
+            self._gpu_rows = self._matrix_rows
+
+    def _update_backend_description(self):
+        if self._use_gpu_search():
+            self.backend_description = "GPU (FAISS GpuIndexFlatIP, CPU IndexFlatIP shadow for persistence)"
+            return
+        if self.ivfpq_active:
+            stages = [f"FAISS IVF-PQ nprobe={self.nprobe}"]
+        elif self.quantize_int8:
+            stages = ["FAISS IndexScalarQuantizer int8"]
+        else:
+            stages = ["FAISS IndexFlatIP"]
+        if self.binary_index is not None:
+            stages.append("binary Hamming prefilter")
+        if self._approximate:
+            stages.append("FP32 rerank")
+        self.backend_description = f"CPU {FAISS_SIMD_LEVEL} ({' + '.join(stages)})"
+
+    def _maybe_switch_to_ivfpq(self, matrix: np.ndarray):
+        """Replace the empty index with a trained IVF-PQ index when a bulk load is large enough."""
+        if self.ivfpq_min_size is None or self.index.ntotal or matrix.shape[0] < self.ivfpq_min_size:
+            return
+        count = matrix.shape[0]
+        nlist = max(1, int(round(np.sqrt(count))))
+        # Aim for 4 dimensions per sub-quantizer; PQ needs the sub-quantizer count to divide D.
+        subquantizers = max(m for m in range(1, max(1, self.feature_dim // 4) + 1) if self.feature_dim % m == 0)
+        ivfpq = faiss.index_factory(
+            self.feature_dim,
+            f"IVF{nlist},PQ{subquantizers}x8",
+            faiss.METRIC_INNER_PRODUCT,
+        )
+        if count > self._IVFPQ_TRAINING_SAMPLE:
+            sample_rows = np.random.default_rng(0).choice(count, self._IVFPQ_TRAINING_SAMPLE, replace=False)
+            sample = matrix[np.sort(sample_rows)]
+        else:
+            sample = matrix
+        logger.info("Training IVF%s,PQ%sx8 on %s vectors", nlist, subquantizers, sample.shape[0])
+        ivfpq.train(sample)
+        faiss.extract_index_ivf(ivfpq).nprobe = self.nprobe
+        # IVF stores ids in its inverted lists; an IndexIDMap2 wrapper would fall out of step with them
+        # on remove_ids because the lists do not compact.
+        self.index = ivfpq
+        self._index_mapped = False
+        self.ivfpq_active = True
+        self._update_backend_description()
+
+    def _new_binary_index(self) -> faiss.IndexBinary:
+        # Binary codes are packed to whole bytes, so round the bit width up to a multiple of 8.
+        code_bits = -(-self.feature_dim // 8) * 8
+        return faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(code_bits))
+
+    @staticmethod
+    def _binarize(vectors: np.ndarray) -> np.ndarray:
+        """Pack the sign bit of every dimension, one row of bytes per vector."""
+        return np.packbits(vectors > 0, axis=1)
+
+    def _own_index(self):
+        """Replace a memory-mapped index with an owned copy; FAISS cannot resize mapped codes."""
+        if self._index_mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self._index_mapped = False
+
+    def _release_cache_mappings(self):
+        """
+        Move the index and feature matrix mapped from a loaded cache into owned memory. Windows refuses
+        to replace a file that is still mapped, so this runs before a save overwrites the cache.
+        """
+        self._own_index()
+        if self._matrix_mapped:
+            self._matrix = np.array(self._matrix)
+            self._matrix_mapped = False
+
+    def _add_to_indexes(self, vectors: np.ndarray, ids: np.ndarray):
+        self._own_index()
+        self.index.add_with_ids(vectors, ids)
+        if self.binary_index is not None:
+            self.binary_index.add_with_ids(self._binarize(vectors), ids)
+
+    def _reset_matrix(self):
+        # Unit-normalized vectors live in one contiguous (capacity, D) matrix; rows
+        # [0, _matrix_rows) are in use and map to products through _row_product_ids.
+        self._matrix = np.empty((0, self.feature_dim), dtype=self.matrix_dtype)
+        # True while _matrix is the copy-on-write mapping of a loaded cache file.
+        self._matrix_mapped = False
+        # Int8 rows carry one float16 scale each (None for float matrices).
+        self._row_scales: Optional[np.ndarray] = np.empty(0, dtype=np.float16) if self._int8_matrix else None
+        self._matrix_rows = 0
+        self._gpu_index = None
+        # PDX copy of the matrix for threshold counts, built on first use and then kept in sync.
+        self._pdx: Optional[np.ndarray] = None
+        self._row_product_ids: List[str] = []
+        self._product_rows: Dict[str, int] = {}
+        # FAISS id of every matrix row; moves with its row on swap-remove.
+        self._row_faiss_ids = np.empty(0, dtype=np.int64)
+        # Dense faiss_id -> matrix row table (-1 for removed ids), so search hits resolve by indexing.
+        self._faiss_id_rows = np.full(0, -1, dtype=np.int32)
+
+    def _set_faiss_id_rows(self, faiss_ids: np.ndarray, rows: np.ndarray):
+        needed = int(faiss_ids.max()) + 1 if len(faiss_ids) else 0
+        if needed > self._faiss_id_rows.shape[0]:
+            capacity = max(needed, 2 * self._faiss_id_rows.shape[0], self._MIN_MATRIX_CAPACITY)
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[: self._faiss_id_rows.shape[0]] = self._faiss_id_rows
+            self._faiss_id_rows = grown
+        self._faiss_id_rows[faiss_ids] = rows
+
+    def _rows_for_faiss_ids(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """Matrix rows for FAISS result ids; padding (-1) and removed ids map to -1."""
+        rows = np.full(faiss_ids.shape, -1, dtype=np.int64)
+        known = (faiss_ids >= 0) & (faiss_ids < self._faiss_id_rows.shape[0])
+        rows[known] = self._faiss_id_rows[faiss_ids[known]]
+        return rows
+
+    @property
+    def _int8_matrix(self) -> bool:
+        return self.matrix_dtype == np.int8
+
+    def _append_rows(self, product_ids: List[str], vectors: np.ndarray, faiss_ids: np.ndarray):
+        needed = self._matrix_rows + len(product_ids)
+        if needed > self._matrix.shape[0]:
+            capacity = max(needed, 2 * self._matrix.shape[0], self._MIN_MATRIX_CAPACITY)
+            grown = np.empty((capacity, self.feature_dim), dtype=self.matrix_dtype)
+            grown[: self._matrix_rows] = self._matrix[: self._matrix_rows]
+            self._matrix = grown
+            self._matrix_mapped = False
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[: self._matrix_rows] = self._row_faiss_ids[: self._matrix_rows]
+            self._row_faiss_ids = grown_ids
+            if self._row_scales is not None:
+                grown_scales = np.empty(capacity, dtype=np.float16)
+                grown_scales[: self._matrix_rows] = self._row_scales[: self._matrix_rows]
+                self._row_scales = grown_scales
+        if self._row_scales is not None:
+            self._matrix[self._matrix_rows : needed], self._row_scales[self._matrix_rows : needed] = (
+                _scoring.quantize_rows(vectors)
+            )
+        else:
+            self._matrix[self._matrix_rows : needed] = vectors
+        if self._pdx is not None:
+            if len(product_ids) == 1:
+                self._pdx = _scoring.pdx_set_row(self._pdx, self._matrix_rows, vectors[0])
+            else:
+                # Rebuilding once beats scattering a bulk load lane by lane.
+                self._pdx = None
+        for offset, product_id in enumerate(product_ids):
+            self._product_rows[product_id] = self._matrix_rows + offset
+        self._row_faiss_ids[self._matrix_rows : needed] = faiss_ids
+        self._set_faiss_id_rows(np.asarray(faiss_ids, dtype=np.int64), np.arange(self._matrix_rows, needed))
+        self._row_product_ids.extend(product_ids)
+        self._matrix_rows = needed
+
+    def _remove_row(self, product_id: str):
+        """Drop a product's row in O(1) by moving the last row into its slot."""
+        row = self._product_rows.pop(product_id, None)
+        if row is None:
+            return
+        self._faiss_id_rows[self._row_faiss_ids[row]] = -1
+        # Rows after this point no longer line up with the GPU mirror.
+        self._gpu_index = None
+        last = self._matrix_rows - 1
+        if self._pdx is not None:
+            _scoring.pdx_move_row(self._pdx, last, row)
+        if row != last:
+            moved_id = self._row_product_ids[last]
+            self._matrix[row] = self._matrix[last]
+            if self._row_scales is not None:
+                self._row_scales[row] = self._row_scales[last]
+            self._row_product_ids[row] = moved_id
+            self._product_rows[moved_id] = row
+            self._row_faiss_ids[row] = self._row_faiss_ids[last]
+            self._faiss_id_rows[self._row_faiss_ids[row]] = row
+        self._row_product_ids.pop()
+        self._matrix_rows = last
+
+    @property
+    def product_id_to_faiss_id(self) -> Dict[str, int]:
+        """product_id -> FAISS id, built from the row-parallel id array (as persisted in the cache metadata)."""
+        return dict(zip(self._row_product_ids, self._row_faiss_ids[: self._matrix_rows].tolist()))
+
+    @property
+    def feature_matrix(self) -> np.ndarray:
+        """View of the in-use (N, D) rows of the normalized feature matrix (int8 codes when quantized)."""
+        return self._matrix[: self._matrix_rows]
+
+    @property
+    def row_scales(self) -> Optional[np.ndarray]:
+        """Per-row float16 scales of an int8 feature matrix, or None for float matrices."""
+        return None if self._row_scales is None else self._row_scales[: self._matrix_rows]
+
+    def get_feature_vector(self, product_id: str) -> Optional[np.ndarray]:
+        row = self._product_rows.get(product_id)
+        if row is None:
+            return None
+        if self._row_scales is not None:
+            return _scoring.dequantize_rows(self._matrix[row : row + 1], self._row_scales[row : row + 1])[0]
+        return self._matrix[row]
+
+    def _float_rows(self, start: int, stop: int) -> np.ndarray:
+        """Rows [start, stop) of the feature matrix as float32."""
+        if self._row_scales is not None:
+            return _scoring.dequantize_rows(self._matrix[start:stop], self._row_scales[start:stop])
+        return np.ascontiguousarray(self._matrix[start:stop], dtype=np.float32)
+
+    def _ensure_trained(self, vectors: np.ndarray):
+        """Fit the scalar quantizer ranges on first insert (no-op for flat indexes)."""
+        if self.index.is_trained:
+            return
+        if vectors.shape[0] < self._MIN_QUANTIZER_TRAINING_SIZE:
+            # Too few samples to estimate per-dimension ranges; unit vectors stay within [-1, 1].
+            bounds = np.array([[self._COSINE_MIN], [self._COSINE_MAX]], dtype="float32")
+            vectors = np.vstack([vectors, np.repeat(bounds, self.feature_dim, axis=1)])
+        self.index.train(vectors)
 
     def _cpu_index_for_persistence(self) -> faiss.Index:
         return self.index
@@ -47,76 +422,253 @@ class SimilaritySearchEngine:
         """Reset index and metadata."""
         self._init_index()
         self.products = []
-        self.feature_vectors = {}
         self.product_lookup = {}
-        self.product_id_to_faiss_id = {}
-        self.faiss_id_to_product_id = {}
         self.next_faiss_id = 0
-        self._feature_matrix_cache = None
+        self._product_dicts = {}
+        self._reset_matrix()
 
-    def _register_product(
-        self,
-        product: Product,
-        normalized_vector: np.ndarray,
-        faiss_id: int,
-        *,
-        position: str = "end",
-    ):
-        if product.id in self.product_lookup:
-            self.remove_product(product.id)
+    def _register_product(self, product: Product, *, position: str = "end"):
         if position == "front":
             self.products.insert(0, product)
         else:
             self.products.append(product)
         self.product_lookup[product.id] = product
-        self.product_id_to_faiss_id[product.id] = faiss_id
-        self.faiss_id_to_product_id[faiss_id] = product.id
-        self.feature_vectors[product.id] = normalized_vector
-        self._feature_matrix_cache = None
+        self._product_dicts.pop(product.id, None)
 
     def add_product(self, product: Product, features: np.ndarray, *, position: str = "end"):
         """
         Add a product to the search index
         """
-        normalized = self._normalize_vector(features)
-        features_2d = normalized.reshape(1, -1).astype("float32")
+        if product.id in self.product_lookup:
+            self.remove_product(product.id)
+        features_2d = self._normalize_rows(np.reshape(features, (1, -1)))
+        self._ensure_trained(features_2d)
         faiss_id = self.next_faiss_id
         self.next_faiss_id += 1
         ids = np.array([faiss_id], dtype="int64")
-        self.index.add_with_ids(features_2d, ids)
-        self._register_product(product, normalized, faiss_id, position=position)
+        self._add_to_indexes(features_2d, ids)
+        self._register_product(product, position=position)
+        self._append_rows([product.id], features_2d, ids)
+
+    def add_products(self, products: List[Product], features: np.ndarray):
+        """
+        Add many products with a single FAISS call. `features` holds one row per product.
+        """
+        # Keep the last occurrence of duplicated ids, as repeated add_product calls would.
+        rows_by_id = {product.id: row for row, product in enumerate(products)}
+        rows = sorted(rows_by_id.values())
+        if not rows:
+            return
+        for product_id in rows_by_id:
+            if product_id in self.product_lookup:
+                self.remove_product(product_id)
 
-    def search(self, query_features: np.ndarray, top_k: int = 10) -> List[SearchResult]:
+        matrix = self._normalize_rows(np.asarray(features)[rows])
+        self._maybe_switch_to_ivfpq(matrix)
+        self._ensure_trained(matrix)
+        ids = np.arange(self.next_faiss_id, self.next_faiss_id + len(rows), dtype="int64")
+        self.next_faiss_id += len(rows)
+        self._add_to_indexes(matrix, ids)
+        for row in rows:
+            self._register_product(products[row])
+        self._append_rows([products[row].id for row in rows], matrix, ids)
+
+    def search(self, query_features: np.ndarray, top_k: int = 10, min_similarity: float = 0.0) -> List[SearchResult]:
+        """
+        Search for similar products, keeping only results scoring at least `min_similarity` (0..1 scale).
         """
-        Search for similar products
+        matches, _ = self._ranked_matches(query_features, top_k, min_similarity)
+        return self._to_results(matches)
+
+    def search_with_count(
+        self, query_features: np.ndarray, top_k: int = 10, min_similarity: float = 0.0
+    ) -> Tuple[List[SearchResult], int]:
+        """
+        `search` plus the `count_matches` total for the same threshold, scoring the catalog once.
+        """
+        matches, total = self._ranked_matches(query_features, top_k, min_similarity, count=True)
+        return self._to_results(matches), total
+
+    def search_payload(self, query_features: np.ndarray, top_k: int = 10, min_similarity: float = 0.0) -> List[dict]:
+        """
+        Same ranking as `search`, returned as JSON-ready dicts shaped like `SearchResult`.
+
+        Product dicts are serialized once per product and shared between responses, so callers
+        must not mutate them.
+        """
+        matches, _ = self._ranked_matches(query_features, top_k, min_similarity)
+        return self._to_payload(matches)
+
+    def search_payload_with_count(
+        self, query_features: np.ndarray, top_k: int = 10, min_similarity: float = 0.0
+    ) -> Tuple[List[dict], int]:
+        """`search_payload` plus the matching total, like `search_with_count`."""
+        matches, total = self._ranked_matches(query_features, top_k, min_similarity, count=True)
+        return self._to_payload(matches), total
+
+    def _to_results(self, matches: List[Tuple[str, float]]) -> List[SearchResult]:
+        return [
+            SearchResult(product=self.product_lookup[product_id], similarity_score=similarity)
+            for product_id, similarity in matches
+        ]
+
+    def _to_payload(self, matches: List[Tuple[str, float]]) -> List[dict]:
+        return [
+            {"product": self._product_dict(product_id), "similarity_score": similarity}
+            for product_id, similarity in matches
+        ]
+
+    def _product_dict(self, product_id: str) -> dict:
+        cached = self._product_dicts.get(product_id)
+        if cached is None:
+            cached = self._product_dicts[product_id] = self.product_serializer(self.product_lookup[product_id])
+        return cached
+
+    def _ranked_matches(
+        self,
+        query_features: np.ndarray,
+        top_k: int,
+        min_similarity: float,
+        *,
+        count: bool = False,
+    ) -> Tuple[List[Tuple[str, float]], Optional[int]]:
+        """
+        Best-first (product_id, client similarity) pairs scoring at least `min_similarity`, plus the
+        number of catalog items meeting that threshold when `count` is set (None otherwise).
         """
         if self.index.ntotal == 0:
-            return []
+            return [], 0 if count else None
 
-        query_features = self._normalize_vector(query_features).reshape(1, -1).astype("float32")
+        query_features = self._normalize_query(query_features)
+        cosine_threshold = self._from_client_threshold(min_similarity) if count else None
 
-        scores, ids = self.index.search(query_features, min(top_k, self.index.ntotal))
-        similarities = self._to_client_similarity(scores[0])
+        if self._use_exact_scan():
+            if not count and _scoring.NUMBA_AVAILABLE and self.matrix_dtype == np.float32:
+                rows, top_scores = _scoring.top_k_early_abort(self.feature_matrix, query_features[0], top_k)
+                return self._threshold_rows(rows, top_scores, min_similarity), None
+            # One scan feeds both the top-k selection and the threshold count.
+            scores = _scoring.inner_product_scores(self.feature_matrix, query_features[0], self.row_scales)
+            total = None
+            if count:
+                total = (
+                    self._matrix_rows
+                    if cosine_threshold <= self._COSINE_MIN
+                    else int(np.count_nonzero(scores >= cosine_threshold))
+                )
+            return self._exact_matches(scores, top_k, min_similarity), total
 
-        results = []
-        for faiss_id, similarity in zip(ids[0], similarities):
-            if faiss_id < 0:
-                continue
-            product_id = self.faiss_id_to_product_id.get(int(faiss_id))
-            if not product_id:
-                continue
-            product = self.product_lookup.get(product_id)
-            if not product:
-                continue
-            results.append(
-                SearchResult(
-                    product=product,
-                    similarity_score=float(similarity),
+        candidate_k = top_k * self.rerank_oversample if self._approximate else top_k
+        scores, rows = self._index_candidates(query_features, candidate_k)
+        matches = self._candidate_matches(
+            query_features[0], None if scores is None else scores[0], rows[0], top_k, min_similarity
+        )
+        # FAISS only returns the top candidates, so the total comes from one counting pass over the matrix.
+        total = self._count_at_least(query_features[0], cosine_threshold) if count else None
+        return matches, total
+
+    def search_payload_batch_with_count(
+        self,
+        query_features: np.ndarray,
+        top_ks: Sequence[int],
+        min_similarities: Sequence[float],
+    ) -> List[Tuple[List[dict], int]]:
+        """
+        `search_payload_with_count` for a (B, D) batch of queries, each with its own top_k and threshold.
+
+        The catalog is scored once for the whole batch: one matrix product on the exact-scan path,
+        otherwise one FAISS search for the largest top_k whose rows are cut back per query.
+        """
+        if self.index.ntotal == 0:
+            return [([], 0) for _ in top_ks]
+        queries = self._normalize_rows(np.reshape(query_features, (len(top_ks), -1)))
+        if self._use_exact_scan():
+            all_scores = _scoring.inner_product_scores_batch(self.feature_matrix, queries, self.row_scales)
+            results = []
+            for column, (top_k, min_similarity) in enumerate(zip(top_ks, min_similarities)):
+                scores = all_scores[:, column]
+                cosine_threshold = self._from_client_threshold(min_similarity)
+                total = (
+                    self._matrix_rows
+                    if cosine_threshold <= self._COSINE_MIN
+                    else int(np.count_nonzero(scores >= cosine_threshold))
                 )
-            )
+                results.append((self._to_payload(self._exact_matches(scores, top_k, min_similarity)), total))
+            return results
 
+        max_top_k = max(top_ks)
+        scores, rows = self._index_candidates(
+            queries, max_top_k * self.rerank_oversample if self._approximate else max_top_k
+        )
+        results = []
+        for position, (top_k, min_similarity) in enumerate(zip(top_ks, min_similarities)):
+            query = queries[position]
+            query_scores = None if scores is None else scores[position]
+            matches = self._candidate_matches(query, query_scores, rows[position], top_k, min_similarity)
+            total = self._count_at_least(query, self._from_client_threshold(min_similarity))
+            results.append((self._to_payload(matches), total))
         return results
 
+    def _index_candidates(self, queries: np.ndarray, candidate_k: int) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Best `candidate_k` (scores, matrix rows) per query row from the GPU mirror or the FAISS indexes.
+        Scores are None when the binary prefilter picked the candidates; padding rows are -1.
+        """
+        candidate_k = min(candidate_k, self.index.ntotal)
+        if self._use_gpu_search():
+            self._sync_gpu_index()
+            # The GPU mirror is built from the matrix, so its ids already are matrix rows.
+            return self._gpu_index.search(queries, candidate_k)
+        if self.binary_index is not None:
+            _, ids = self.binary_index.search(self._binarize(queries), candidate_k)
+            scores = None
+        else:
+            scores, ids = self.index.search(queries, candidate_k)
+        return scores, self._rows_for_faiss_ids(ids)
+
+    def _candidate_matches(
+        self,
+        query: np.ndarray,
+        scores: Optional[np.ndarray],
+        rows: np.ndarray,
+        top_k: int,
+        min_similarity: float,
+    ) -> List[Tuple[str, float]]:
+        if self._approximate:
+            scores, rows = self._rerank(query, rows, top_k)
+        else:
+            # Candidates come back best first, so a query with a smaller top_k keeps a prefix.
+            scores, rows = scores[:top_k], rows[:top_k]
+        similarities = self._to_client_similarity(scores)
+        # Filter on the score arrays so sub-threshold and padding hits are never looked up.
+        keep = (similarities >= min_similarity) & (rows >= 0)
+        return [
+            (self._row_product_ids[row], float(similarity)) for row, similarity in zip(rows[keep], similarities[keep])
+        ]
+
+    def _use_exact_scan(self) -> bool:
+        return not self._approximate and self.index.ntotal < self.exact_scan_max_size
+
+    def _exact_matches(self, scores: np.ndarray, top_k: int, min_similarity: float) -> List[Tuple[str, float]]:
+        rows = _scoring.top_k_rows(scores, top_k)
+        return self._threshold_rows(rows, scores[rows], min_similarity)
+
+    def _threshold_rows(self, rows: np.ndarray, scores: np.ndarray, min_similarity: float) -> List[Tuple[str, float]]:
+        similarities = self._to_client_similarity(scores)
+        keep = similarities >= min_similarity
+        rows, similarities = rows[keep], similarities[keep]
+        return [(self._row_product_ids[row], float(similarity)) for row, similarity in zip(rows, similarities)]
+
+    def _rerank(self, query: np.ndarray, candidate_rows: np.ndarray, top_k: int):
+        """Re-score approximate FAISS candidates (as matrix rows) against the stored feature matrix."""
+        rows = candidate_rows[candidate_rows >= 0]
+        if not rows.size:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        # Fancy indexing gathers the candidates into one contiguous block for a single GEMV.
+        row_scales = None if self._row_scales is None else self._row_scales[rows]
+        exact_scores = _scoring.inner_product_scores(self._matrix[rows], query, row_scales)
+        order = np.argsort(-exact_scores, kind="stable")[:top_k]
+        return exact_scores[order], rows[order]
+
     def build_index_from_directory(
         self,
         directory: Union[str, Path],
@@ -139,12 +691,18 @@ class SimilaritySearchEngine:
             return
 
         self.reset()
+        # Reading in inode order keeps a cold-cache scan close to sequential on disk.
+        image_paths.sort(key=lambda path: path.stat().st_ino)
 
         def load_image(path: Path):
-            img = cv2.imread(str(path))
+            # Read and decode separately: JPEGs through libjpeg-turbo when it is available, everything
+            # else through OpenCV. Images stay BGR; the extractor swaps channels after resizing.
+            contents = path.read_bytes()
+            img = decode_jpeg_bgr(contents) if contents.startswith(JPEG_MAGIC) else None
+            if img is None:
+                img = decode_image_bgr(contents)
             if img is None:
                 raise ValueError("Failed to read image")
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             product_id = path.stem
             product = Product(
                 id=product_id,
@@ -155,35 +713,68 @@ class SimilaritySearchEngine:
 
         batch_products: List[Product] = []
         batch_images: List[np.ndarray] = []
+        # Every embedding is written into one preallocated matrix and indexed in a single call,
+        # which also lets the int8 quantizer train on the whole catalog.
+        features_buffer = np.empty((len(image_paths), self.feature_dim), dtype=np.float32)
+        extracted: List[Product] = []
 
+        # Decoders stay at most two batches ahead of extraction, so decoded images never pile up in memory.
+        max_in_flight = 2 * batch_size
+        pending_paths = iter(image_paths)
+        future_to_path: Dict[Future, Path] = {}
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_path = {executor.submit(load_image, path): path for path in image_paths}
-            for future in as_completed(future_to_path):
-                path = future_to_path[future]
-                try:
-                    product, img = future.result()
-                    batch_products.append(product)
-                    batch_images.append(img)
-                except Exception as exc:
-                    logger.warning("Error processing %s: %s", path, exc)
-                    continue
-
-                if len(batch_images) >= batch_size:
-                    self._process_batch(batch_products, batch_images, feature_extractor)
-                    batch_products, batch_images = [], []
+            while True:
+                for path in islice(pending_paths, max_in_flight - len(future_to_path)):
+                    future_to_path[executor.submit(load_image, path)] = path
+                if not future_to_path:
+                    break
+                done, _ = wait(future_to_path, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = future_to_path.pop(future)
+                    try:
+                        product, img = future.result()
+                        batch_products.append(product)
+                        batch_images.append(img)
+                    except Exception as exc:
+                        logger.warning("Error processing %s: %s", path, exc)
+                        continue
+
+                    if len(batch_images) >= batch_size:
+                        extracted += self._process_batch(
+                            batch_products,
+                            batch_images,
+                            feature_extractor,
+                            out=features_buffer[len(extracted):],
+                        )
+                        batch_products, batch_images = [], []
 
         if batch_images:
-            self._process_batch(batch_products, batch_images, feature_extractor)
+            extracted += self._process_batch(
+                batch_products,
+                batch_images,
+                feature_extractor,
+                out=features_buffer[len(extracted):],
+            )
+        self.add_products(extracted, features_buffer[: len(extracted)])
 
-    def _process_batch(self, products: List[Product], images: List[np.ndarray], feature_extractor):
+    def _process_batch(
+        self,
+        products: List[Product],
+        images: List[np.ndarray],
+        feature_extractor,
+        out: np.ndarray,
+    ) -> List[Product]:
+        """Embed one batch into `out` and return the products whose rows were written."""
         if not products:
-            return
+            return []
         try:
-            features_batch = feature_extractor.extract_features_batch(images)
-            for product, features in zip(products, features_batch):
-                self.add_product(product, features)
+            features_batch = feature_extractor.extract_features_batch(images, out=out, bgr=True)
+            if not np.shares_memory(features_batch, out):
+                out[: len(images)] = features_batch
+            return products
         except Exception as exc:
             logger.warning("Error extracting batch features: %s", exc)
+            return []
 
     def get_all_products(self) -> List[Product]:
         """
@@ -195,7 +786,7 @@ class SimilaritySearchEngine:
         """
         Get number of products in catalog
         """
-        return len(self.products)
+        return len(self.product_lookup)
 
     def describe_backend(self) -> str:
         """Return a human-readable description of the FAISS execution device."""
@@ -205,91 +796,257 @@ class SimilaritySearchEngine:
         """
         Save FAISS index and metadata to disk
         """
-        index_to_save = self._cpu_index_for_persistence()
-        faiss.write_index(index_to_save, f"{path}.index")
-        with open(f"{path}.pkl", "wb") as f:
-            pickle.dump(
-                {
-                    "products": self.products,
-                    "feature_vectors": self.feature_vectors,
-                    "product_id_to_faiss_id": self.product_id_to_faiss_id,
-                    "next_faiss_id": self.next_faiss_id,
-                    "feature_dim": self.feature_dim,
-                },
-                f,
-            )
+        self.write_snapshot(self.snapshot(), path)
+
+    def snapshot(self) -> IndexSnapshot:
+        """
+        In-memory copy of everything `save_index` writes. Callers that serialize mutations with a
+        lock take the snapshot under it and write it with `write_snapshot` after releasing it.
+        """
+        # The cache files may be the ones this engine was loaded (and is still mapped) from.
+        self._release_cache_mappings()
+        binary_index_bytes = None
+        if self.binary_index is not None:
+            binary_index_bytes = faiss.serialize_index_binary(self.binary_index)
+        return IndexSnapshot(
+            index_bytes=faiss.serialize_index(self._cpu_index_for_persistence()),
+            binary_index_bytes=binary_index_bytes,
+            matrix=self.feature_matrix.copy(),
+            row_scales=None if self._row_scales is None else self.row_scales.copy(),
+            products=list(self.products),
+            row_product_ids=list(self._row_product_ids),
+            row_faiss_ids=self._row_faiss_ids[: self._matrix_rows].copy(),
+            next_faiss_id=self.next_faiss_id,
+            feature_dim=self.feature_dim,
+            index_kind=self.index_kind,
+        )
+
+    @classmethod
+    def write_snapshot(cls, snapshot: IndexSnapshot, path: str):
+        """Write `snapshot` to the cache files at `path`, each through a temp file and `os.replace`."""
+        # Swapping finished files in means a crash mid-save never leaves a truncated cache file.
+        cls._replace_file(f"{path}.index", snapshot.index_bytes.tofile)
+        if snapshot.binary_index_bytes is not None:
+            cls._replace_file(f"{path}.bin", snapshot.binary_index_bytes.tofile)
+        cls._replace_file(cls._matrix_path(path, snapshot.matrix.dtype), snapshot.matrix.tofile)
+        if snapshot.row_scales is not None:
+            cls._replace_file(f"{path}.scales", snapshot.row_scales.tofile)
+        metadata = {
+            "products": [product.model_dump() for product in snapshot.products],
+            "row_product_ids": snapshot.row_product_ids,
+            "matrix_dtype": snapshot.matrix.dtype.name,
+            "product_id_to_faiss_id": dict(zip(snapshot.row_product_ids, snapshot.row_faiss_ids.tolist())),
+            "next_faiss_id": snapshot.next_faiss_id,
+            "feature_dim": snapshot.feature_dim,
+            "index_kind": snapshot.index_kind,
+        }
+        encoded = orjson.dumps(metadata) if orjson is not None else json.dumps(metadata).encode("utf-8")
+
+        def write_metadata(tmp_path: str):
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+
+        cls._replace_file(f"{path}.meta.json", write_metadata)
+
+    @staticmethod
+    def _replace_file(target: str, write: Callable[[str], None]):
+        tmp_path = f"{target}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, target)
+
+    @staticmethod
+    def has_cached_index(path: str) -> bool:
+        """Whether `save_index` output (or a legacy pickle cache) exists at `path`."""
+        metadata_exists = os.path.exists(f"{path}.meta.json") or os.path.exists(f"{path}.pkl")
+        return os.path.exists(f"{path}.index") and metadata_exists
+
+    @staticmethod
+    def _read_metadata(path: str) -> dict:
+        metadata_path = f"{path}.meta.json"
+        if not os.path.exists(metadata_path):
+            # Caches written before the JSON metadata pickled the Product objects directly.
+            with open(f"{path}.pkl", "rb") as f:
+                return pickle.load(f)
+        with open(metadata_path, "rb") as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        # The cache is written by save_index from validated products, so skip re-validation.
+        data["products"] = [Product.model_construct(**product) for product in data.get("products", [])]
+        return data
 
     def load_index(self, path: str):
         """
         Load FAISS index and metadata from disk
         """
-        cpu_index = faiss.read_index(f"{path}.index")
+        data = self._read_metadata(path)
+        cached_kind = data.get("index_kind", "flat")
+        # Flat and SQ8 codes are mapped instead of read: startup skips the copy, pages fault in on
+        # first search and worker processes share the page cache until the index is first modified.
+        mapped = _MMAP_INDEX_FLAG is not None and cached_kind != "ivfpq"
+        cpu_index = faiss.read_index(f"{path}.index", _MMAP_INDEX_FLAG) if mapped else faiss.read_index(f"{path}.index")
+        # IVF-PQ is chosen by catalog size at build time, so it is acceptable whenever enabled.
+        ivfpq_cache = cached_kind == "ivfpq" and self.ivfpq_min_size is not None
+        if cached_kind != self.index_kind and not ivfpq_cache:
+            raise ValueError(f"Cached index layout {cached_kind!r} does not match configured {self.index_kind!r}.")
+        if ivfpq_cache and not isinstance(cpu_index, faiss.IndexIVF):
+            # Older caches wrapped IVF-PQ in an IndexIDMap2, which corrupts the id mapping on removal.
+            raise ValueError("Cached IVF-PQ index uses an ID map wrapper; rebuilding.")
+        # The int8 scalar quantizer ranges and IVF-PQ codebooks are serialized inside the FAISS index file.
         self.index = cpu_index
-        with open(f"{path}.pkl", "rb") as f:
-            data = pickle.load(f)
-            self.products = data.get("products", [])
-            self.feature_vectors = data.get("feature_vectors", {})
-            self.product_lookup = {product.id: product for product in self.products}
-            self.product_id_to_faiss_id = data.get("product_id_to_faiss_id", {})
-            self.faiss_id_to_product_id = {faiss_id: pid for pid, faiss_id in self.product_id_to_faiss_id.items()}
-            self.next_faiss_id = data.get("next_faiss_id", len(self.products))
-            self.feature_dim = data.get("feature_dim", self.feature_dim)
-            self._feature_matrix_cache = None
+        self._index_mapped = mapped
+        self.ivfpq_active = ivfpq_cache
+        if ivfpq_cache:
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        self.products = data.get("products", [])
+        self.product_lookup = {product.id: product for product in self.products}
+        self._product_dicts = {}
+        self.next_faiss_id = data.get("next_faiss_id", len(self.products))
+        self.feature_dim = data.get("feature_dim", self.feature_dim)
+        self._load_matrix(path, data)
+        if self.binary_prefilter:
+            self._load_binary_index(Path(f"{path}.bin"))
+        self._update_backend_description()
+
+    @staticmethod
+    def _matrix_path(path: str, dtype: np.dtype) -> str:
+        return f"{path}.{dtype.kind}{dtype.itemsize * 8}"
+
+    def _load_matrix(self, path: str, data: dict):
+        self._reset_matrix()
+        faiss_ids_by_product: Dict[str, int] = data.get("product_id_to_faiss_id", {})
+
+        def faiss_ids(product_ids: List[str]) -> np.ndarray:
+            return np.array([faiss_ids_by_product[product_id] for product_id in product_ids], dtype=np.int64)
+
+        if "feature_vectors" in data:
+            # Caches written before the contiguous matrix stored a product_id -> vector dict.
+            vectors: Dict[str, np.ndarray] = data["feature_vectors"]
+            if vectors:
+                self._append_rows(list(vectors), np.stack(list(vectors.values())), faiss_ids(list(vectors)))
+            return
+        row_product_ids: List[str] = data.get("row_product_ids", [])
+        if not row_product_ids:
+            return
+        row_faiss_ids = faiss_ids(row_product_ids)
+        stored_dtype = np.dtype(data.get("matrix_dtype", "float32"))
+        # Copy-on-write mapping: pages load lazily and in-place row moves never touch the cache file.
+        matrix = np.asarray(
+            np.memmap(
+                self._matrix_path(path, stored_dtype),
+                dtype=stored_dtype,
+                mode="c",
+                shape=(len(row_product_ids), self.feature_dim),
+            )
+        )
+        stored_scales = None
+        if stored_dtype == np.int8:
+            stored_scales = np.fromfile(f"{path}.scales", dtype=np.float16, count=len(row_product_ids))
+        if stored_dtype != self.matrix_dtype and (stored_scales is not None or self._int8_matrix):
+            # Switching to or from int8 storage re-quantizes through float32.
+            if stored_scales is not None:
+                matrix = _scoring.dequantize_rows(matrix, stored_scales)
+            self._append_rows(list(row_product_ids), matrix, row_faiss_ids)
+            return
+        self._matrix = matrix if stored_dtype == self.matrix_dtype else matrix.astype(self.matrix_dtype)
+        self._matrix_mapped = stored_dtype == self.matrix_dtype
+        self._row_scales = stored_scales
+        self._matrix_rows = len(row_product_ids)
+        self._row_product_ids = list(row_product_ids)
+        self._product_rows = {product_id: row for row, product_id in enumerate(row_product_ids)}
+        self._row_faiss_ids = row_faiss_ids
+        self._set_faiss_id_rows(row_faiss_ids, np.arange(self._matrix_rows))
+
+    def _load_binary_index(self, path: Path):
+        if path.exists():
+            self.binary_index = faiss.read_index_binary(str(path))
+            if self.binary_index.ntotal == self.index.ntotal:
+                return
+        # Missing or stale prefilter: the sign bits are cheap to recompute from the FP32 vectors.
+        self.binary_index = self._new_binary_index()
+        if self._matrix_rows:
+            self.binary_index.add_with_ids(
+                self._binarize(self.feature_matrix), self._row_faiss_ids[: self._matrix_rows]
+            )
 
     def get_product(self, product_id: str) -> Optional[Product]:
         return self.product_lookup.get(product_id)
 
     def remove_product(self, product_id: str) -> Optional[Product]:
-        faiss_id = self.product_id_to_faiss_id.get(product_id)
-        if faiss_id is None:
+        row = self._product_rows.get(product_id)
+        if row is None:
             return None
+        faiss_id = int(self._row_faiss_ids[row])
         selector = faiss.IDSelectorArray(np.array([faiss_id], dtype="int64"))
+        self._own_index()
         self.index.remove_ids(selector)
+        if self.binary_index is not None:
+            self.binary_index.remove_ids(selector)
         removed_product = self.product_lookup.pop(product_id, None)
-        self.product_id_to_faiss_id.pop(product_id, None)
-        self.faiss_id_to_product_id.pop(faiss_id, None)
-        self.feature_vectors.pop(product_id, None)
-        self.products = [p for p in self.products if p.id != product_id]
-        self._feature_matrix_cache = None
+        self._product_dicts.pop(product_id, None)
+        self._remove_row(product_id)
+        self._removed_ids.add(product_id)
         return removed_product
 
-    def _normalize_vector(self, vector: np.ndarray) -> np.ndarray:
-        norm = np.linalg.norm(vector)
-        if norm == 0:
-            return vector.astype("float32")
-        return (vector / norm).astype("float32")
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """
+        Return an L2-normalized float32 copy of `matrix` (zero rows stay zero).
+
+        One owned copy is made and FAISS's vectorized normalize_L2 runs on it in place; the
+        extractor's already-unit vectors simply come out unchanged.
+        """
+        normalized = np.array(matrix, dtype="float32", order="C")
+        faiss.normalize_L2(normalized)
+        return normalized
+
+    @staticmethod
+    def _normalize_query(query_features: np.ndarray) -> np.ndarray:
+        """
+        `_normalize_rows` for one query, written into this thread's scratch buffer instead of a new
+        array. The result is overwritten by the thread's next query, so it must not be kept.
+        """
+        flat = np.reshape(query_features, -1)
+        scratch = getattr(_QUERY_SCRATCH, "buffer", None)
+        if scratch is None or scratch.shape[1] != flat.shape[0]:
+            scratch = np.empty((1, flat.shape[0]), dtype="float32")
+            _QUERY_SCRATCH.buffer = scratch
+        scratch[0] = flat
+        faiss.normalize_L2(scratch)
+        return scratch
 
     def count_matches(self, query_features: np.ndarray, threshold: float) -> int:
         """
         Count how many catalog items meet or exceed the provided cosine similarity threshold.
         """
-        feature_matrix = self._get_feature_matrix()
-        if feature_matrix is None:
+        if self._matrix_rows == 0:
             return 0
 
-        cosine_threshold = self._from_client_threshold(threshold)
-        if cosine_threshold <= self._COSINE_MIN:
-            return len(self.feature_vectors)
-
-        normalized_query = self._normalize_vector(query_features)
-        similarities = feature_matrix @ normalized_query.astype("float32")
-        similarities = np.clip(similarities, self._COSINE_MIN, self._COSINE_MAX)
-        return int(np.count_nonzero(similarities >= cosine_threshold))
+        normalized_query = self._normalize_query(query_features)[0]
+        return self._count_at_least(normalized_query, self._from_client_threshold(threshold))
 
-    def _get_feature_matrix(self) -> Optional[np.ndarray]:
-        if not self.feature_vectors:
-            return None
-        if (
-            self._feature_matrix_cache is None
-            or self._feature_matrix_cache.shape[0] != len(self.feature_vectors)
-        ):
-            self._feature_matrix_cache = np.stack(list(self.feature_vectors.values()))
-        return self._feature_matrix_cache
+    def _count_at_least(self, normalized_query: np.ndarray, cosine_threshold: float) -> int:
+        if cosine_threshold <= self._COSINE_MIN:
+            return self._matrix_rows
+        # Scores above 1.0 from rounding still satisfy any threshold <= 1, so no clipping is needed.
+        if self._pdx_enabled:
+            if self._pdx is None:
+                self._pdx = _scoring.to_pdx(self.feature_matrix)
+            return _scoring.count_at_least_pdx(self._pdx, self._matrix_rows, normalized_query, cosine_threshold)
+        if self.index_kind == "flat":
+            # The exact flat index counts natively and only materializes the hits. FAISS keeps inner
+            # products strictly above the radius, so step just below the threshold to keep ">=".
+            radius = float(np.nextafter(np.float32(cosine_threshold), np.float32(-np.inf)))
+            lims, _, _ = self.index.range_search(normalized_query[None, :], radius)
+            return int(lims[1] - lims[0])
+        return _scoring.count_at_least(self.feature_matrix, normalized_query, cosine_threshold, self.row_scales)
 
     @classmethod
     def _to_client_similarity(cls, cosine_scores: np.ndarray) -> np.ndarray:
         """Map cosine scores (-1..1) to the 0..1 scale exposed to API clients."""
-        return (np.clip(cosine_scores, cls._COSINE_MIN, cls._COSINE_MAX) + 1.0) / 2.0
+        # One output buffer, updated in place: scale and shift, then clip to the client range.
+        similarities = np.multiply(cosine_scores, 0.5, dtype=np.float32)
+        similarities += 0.5
+        return np.clip(similarities, 0.0, 1.0, out=similarities)
 
     @classmethod
     def _from_client_threshold(cls, threshold: float) -> float:
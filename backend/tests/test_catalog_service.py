@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import contextlib
 from pathlib import Path
 
 import numpy as np
+import pytest
 
 from ..config import AppConfig
 from ..models import Product
@@ -17,8 +19,11 @@ class DummyExtractor:
     def extract_features(self, image):
         return np.ones(self.feature_dim, dtype=np.float32)
 
-    def extract_features_batch(self, images):
-        return [self.extract_features(None) for _ in images]
+    def extract_features_batch(self, images, out=None, bgr=False):
+        return np.stack([self.extract_features(None) for _ in images])
+
+    def reserve_cpu_threads(self, count):
+        return contextlib.nullcontext()
 
 
 def build_service(tmp_path: Path) -> CatalogService:
@@ -49,3 +54,162 @@ def test_catalog_snapshot_detects_new_disk_files(tmp_path):
     new_image.write_bytes(b"0")
 
     assert service._catalog_snapshot_matches_index() is False
+
+
+def test_startup_trusts_fingerprint_until_catalog_dir_changes(tmp_path, monkeypatch):
+    import cv2
+
+    service = build_service(tmp_path)
+    service.config = service.config.model_copy(update={"cache_index_on_startup": True})
+    for idx in range(2):
+        cv2.imwrite(str(service.config.catalog_dir / f"prod_{idx}.jpg"), np.zeros((8, 8, 3), dtype=np.uint8))
+    assert service.startup()["used_cache"] is False
+    assert service._fingerprint_path.exists()
+
+    reloaded = CatalogService(DummyExtractor(), service.config)
+    monkeypatch.setattr(reloaded, "_catalog_snapshot_matches_index", lambda: pytest.fail("full scan"))
+    catalog_dir = service.config.catalog_dir.resolve()
+    real_exists = Path.exists
+
+    def exists(path):
+        if catalog_dir in Path(path).resolve().parents:
+            pytest.fail(f"per-image stat of {path}")
+        return real_exists(path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Path, "exists", exists)
+        assert reloaded.startup()["used_cache"] is True
+
+    (service.config.catalog_dir / "prod_2.jpg").write_bytes(b"0")
+    changed = CatalogService(DummyExtractor(), service.config)
+    assert changed._load_cached_index_if_valid() is False
+
+
+def test_background_saver_coalesces_edits(tmp_path):
+    import asyncio
+
+    service = build_service(tmp_path)
+    service.config = service.config.model_copy(
+        update={"cache_index_on_startup": True, "index_save_debounce_seconds": 0.05}
+    )
+    saves = []
+    service.search_engine.write_snapshot = lambda snapshot, path: saves.append(path)
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    async def scenario():
+        saver = asyncio.create_task(service.run_index_saver())
+        await asyncio.sleep(0)
+        service.add_product(image, product_id="a")
+        service.add_product(image, product_id="b")
+        assert saves == []
+        await asyncio.sleep(0.2)
+        assert len(saves) == 1
+        service.delete_product("a")
+        saver.cancel()
+        await asyncio.gather(saver, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert len(saves) == 2
+    assert service.search_engine.get_catalog_size() == 1
+
+
+def test_index_mutations_do_not_wait_for_cache_writes(tmp_path):
+    import asyncio
+    import threading
+
+    service = build_service(tmp_path)
+    service.config = service.config.model_copy(update={"cache_index_on_startup": True})
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    service.add_product(image, product_id="a")
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_write(snapshot, path):
+        writing.set()
+        release.wait(10)
+
+    service.search_engine.write_snapshot = slow_write
+    # As with the background saver running: mutations only flag a save instead of writing inline.
+    service._save_pending = asyncio.Event()
+    saver = threading.Thread(target=service._cache_index_to_disk)
+    saver.start()
+    try:
+        assert writing.wait(10)
+        service.add_product(image, product_id="b")
+        service.delete_product("a")
+        # Both mutations finished while the write was still in progress.
+        assert saver.is_alive()
+    finally:
+        release.set()
+        saver.join()
+    assert [product.id for product in service.search_engine.products] == ["b"]
+
+
+def test_search_batcher_coalesces_concurrent_searches(tmp_path):
+    import asyncio
+
+    service = build_service(tmp_path)
+    service.config = service.config.model_copy(update={"search_batch_window_ms": 50.0})
+    vectors = np.eye(4, dtype=np.float32)
+    service.search_engine.add_products(
+        [Product(id=f"p{idx}", name=f"p{idx}", image_path=f"p{idx}.jpg") for idx in range(4)], vectors
+    )
+    batch_sizes = []
+    run_batch = service.search_engine.search_payload_batch_with_count
+
+    def spy(queries, top_ks, thresholds):
+        batch_sizes.append(len(top_ks))
+        return run_batch(queries, top_ks, thresholds)
+
+    service.search_engine.search_payload_batch_with_count = spy
+
+    async def scenario():
+        batcher = asyncio.create_task(service.run_search_batcher())
+        await asyncio.sleep(0)
+        results = await asyncio.gather(*(service.search_batched(vector, 0.9, 2) for vector in vectors))
+        batcher.cancel()
+        await asyncio.gather(batcher, return_exceptions=True)
+        return results
+
+    results = asyncio.run(scenario())
+    assert batch_sizes == [4]
+    assert results == [service.search(vector, 0.9, 2) for vector in vectors]
+    assert [payload[0]["product"]["id"] for payload, _ in results] == ["p0", "p1", "p2", "p3"]
+
+
+def test_search_batcher_scores_off_the_event_loop_under_the_index_lock(tmp_path):
+    import asyncio
+    import threading
+
+    service = build_service(tmp_path)
+    service.config = service.config.model_copy(update={"search_batch_window_ms": 1.0})
+    query = np.eye(1, 4, dtype=np.float32)
+    service.search_engine.add_products([Product(id="p0", name="p0", image_path="p0.jpg")], query)
+    scoring, release = threading.Event(), threading.Event()
+    lock_held = []
+    run_batch = service.search_engine.search_payload_batch_with_count
+
+    def blocking(queries, top_ks, thresholds):
+        lock_held.append(service._index_lock.locked())
+        scoring.set()
+        release.wait(5)
+        return run_batch(queries, top_ks, thresholds)
+
+    service.search_engine.search_payload_batch_with_count = blocking
+
+    async def scenario():
+        batcher = asyncio.create_task(service.run_search_batcher())
+        await asyncio.sleep(0)
+        search = asyncio.ensure_future(service.search_batched(query, 0.5, 1))
+        # The loop keeps running while the batch is blocked in the worker thread.
+        while not scoring.is_set():
+            await asyncio.sleep(0.001)
+        assert not search.done()
+        release.set()
+        payload, total = await search
+        batcher.cancel()
+        await asyncio.gather(batcher, return_exceptions=True)
+        return payload, total
+
+    payload, total = asyncio.run(scenario())
+    assert lock_held == [True]
+    assert total == 1 and payload[0]["product"]["id"] == "p0"
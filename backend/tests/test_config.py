@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import pytest
+from pydantic import ValidationError
+
+from ..config import AppConfig
+
+
+def test_supported_image_formats_are_normalized_and_deduplicated():
+    config = AppConfig(supported_image_formats=(" JPG", ".jpg", "png", "", "..webp", ".PNG"))
+
+    assert config.supported_image_formats == (".jpg", ".png", ".webp")
+
+
+def test_supported_image_formats_rejects_empty_list():
+    with pytest.raises(ValidationError):
+        AppConfig(supported_image_formats=(" ", ""))
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import numpy as np
+import open_clip
+import pytest
+import torch
+from torch import nn
+
+from .. import feature_extractor as fe_module
+from ..feature_extractor import FeatureExtractor
+
+
+class DummyVisual(nn.Module):
+    def __init__(self, output_dim: int = 8):
+        super().__init__()
+        self.output_dim = output_dim
+        self.proj = nn.Linear(3, output_dim)
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.proj(batch.mean(dim=(2, 3)))
+
+
+class DummyClip(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.visual = DummyVisual()
+
+    def encode_image(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.visual(batch)
+
+
+@pytest.fixture
+def extractor(monkeypatch) -> FeatureExtractor:
+    preprocess = open_clip.image_transform(
+        32,
+        is_train=False,
+        mean=open_clip.OPENAI_DATASET_MEAN,
+        std=open_clip.OPENAI_DATASET_STD,
+    )
+
+    def fake_create(model_name, pretrained=None, **kwargs):
+        return DummyClip(), None, preprocess
+
+    monkeypatch.setattr(fe_module.open_clip, "create_model_and_transforms", fake_create)
+    return FeatureExtractor(force_cpu=True)
+
+
+def test_prepare_batch_matches_openclip_preprocess(extractor):
+    from PIL import Image
+
+    horizontal = np.broadcast_to(np.linspace(0, 255, 64, dtype=np.float32), (48, 64))
+    vertical = np.broadcast_to(np.linspace(0, 255, 48, dtype=np.float32)[:, None], (48, 64))
+    images = [
+        np.stack([horizontal, vertical, 255 - horizontal], axis=-1).astype(np.uint8),
+        np.stack([255 - vertical, horizontal, vertical], axis=-1).astype(np.uint8),
+    ]
+
+    batch = extractor._prepare_batch(images)
+    reference = torch.stack([extractor.preprocess(Image.fromarray(img)) for img in images])
+
+    assert batch.shape == (2, 3, 32, 32)
+    assert (batch - reference).abs().mean() < 0.05
+
+
+def test_prepare_batch_falls_back_to_pil_for_grayscale_inputs(extractor):
+    gray = np.linspace(0, 255, 48 * 64, dtype=np.float32).reshape(48, 64).astype(np.uint8)
+
+    batch = extractor._prepare_batch([gray])
+
+    assert batch.shape == (1, 3, 32, 32)
+
+
+def test_extract_features_batch_returns_unit_vectors(extractor):
+    images = [np.full((40, 30, 3), value, dtype=np.uint8) for value in (10, 200)]
+
+    features = extractor.extract_features_batch(images)
+
+    assert features.shape == (2, extractor.feature_dim)
+    assert np.allclose(np.linalg.norm(features, axis=1), 1.0, atol=1e-5)
+
+
+def test_extract_features_batch_writes_into_out_buffer(extractor):
+    images = [np.full((40, 30, 3), value, dtype=np.uint8) for value in (10, 200)]
+    out = np.zeros((5, extractor.feature_dim), dtype=np.float32)
+
+    result = extractor.extract_features_batch(images, out=out[1:])
+
+    assert np.shares_memory(result, out)
+    assert np.allclose(out[1:3], extractor.extract_features_batch(images), atol=1e-6)
+    assert not out[0].any() and not out[3:].any()
+
+
+def test_bgr_inputs_match_rgb_inputs(extractor):
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, size=(40, 52, 3), dtype=np.uint8)
+    bgr = np.ascontiguousarray(rgb[..., ::-1])
+
+    assert torch.allclose(extractor._prepare_batch([bgr], bgr=True), extractor._prepare_batch([rgb]))
+    assert np.allclose(
+        extractor.extract_features_batch([bgr], bgr=True),
+        extractor.extract_features_batch([rgb]),
+        atol=1e-6,
+    )
+
+
+def test_query_ensemble_matches_mean_of_variant_embeddings(extractor):
+    image = np.tile(np.arange(32, dtype=np.uint8)[None, :, None] * 8, (32, 1, 3))
+
+    flipped = np.ascontiguousarray(image[:, ::-1])
+
+    ensemble = extractor.extract_query_ensemble(image, horizontal_flip=True, crop_ratio=None)
+    from_variants = extractor.extract_query_vector([image, flipped])
+    separate = extractor.extract_features_batch([image, flipped])
+    expected = separate.mean(axis=0)
+    expected /= np.linalg.norm(expected)
+
+    assert ensemble.shape == (extractor.feature_dim,)
+    assert np.allclose(ensemble, expected, atol=1e-5)
+    assert np.allclose(from_variants, expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("batch_size,expected", [(1, 1), (3, 3), (5, 8), (17, 32), (40, 40)])
+def test_bucket_size_rounds_up_to_compiled_shapes(batch_size, expected):
+    assert FeatureExtractor._bucket_size(batch_size) == expected
+
+
+def test_onnx_extractor_matches_torch_embeddings(monkeypatch, tmp_path, extractor):
+    pytest.importorskip("onnxruntime")
+    from ..feature_extractor_onnx import OnnxFeatureExtractor
+
+    preprocess = extractor.preprocess
+    model = extractor.model
+    monkeypatch.setattr(
+        fe_module.open_clip,
+        "create_model_and_transforms",
+        lambda *args, **kwargs: (model, None, preprocess),
+    )
+    onnx_extractor = OnnxFeatureExtractor(force_cpu=True, cache_dir=tmp_path)
+    images = [np.full((40, 30, 3), value, dtype=np.uint8) for value in (10, 200, 90)]
+
+    expected = extractor.extract_features_batch(images)
+    actual = onnx_extractor.extract_features_batch(images)
+
+    assert (tmp_path / "ViT-B-32-openai.onnx").exists()
+    assert onnx_extractor.model is None
+    assert onnx_extractor._dtype == torch.float32
+    assert np.allclose(actual, expected, atol=1e-4)
+
+
+def test_weights_cache_is_written_and_reused(monkeypatch, tmp_path):
+    preprocess = open_clip.image_transform(32, is_train=False)
+    calls = []
+
+    def fake_create(model_name, pretrained=None, **kwargs):
+        calls.append(pretrained)
+        return DummyClip(), None, preprocess
+
+    monkeypatch.setattr(fe_module.open_clip, "create_model_and_transforms", fake_create)
+    first = FeatureExtractor(force_cpu=True, weights_cache_dir=tmp_path)
+    second = FeatureExtractor(force_cpu=True, weights_cache_dir=tmp_path)
+
+    assert (tmp_path / "ViT-B-32-openai.safetensors").exists()
+    assert calls == ["openai", None]
+    for name, tensor in first.model.state_dict().items():
+        assert torch.equal(tensor, second.model.state_dict()[name])
+
+
+def test_prepare_batch_accepts_chw_tensors(extractor):
+    horizontal = np.broadcast_to(np.linspace(0, 255, 64, dtype=np.float32), (48, 64))
+    vertical = np.broadcast_to(np.linspace(0, 255, 48, dtype=np.float32)[:, None], (48, 64))
+    image = np.stack([horizontal, vertical, 255 - horizontal], axis=-1).astype(np.uint8)
+
+    from_tensor = extractor._prepare_batch([torch.from_numpy(image).permute(2, 0, 1)])
+    from_array = extractor._prepare_batch([image])
+
+    assert from_tensor.shape == from_array.shape
+    assert (from_tensor - from_array).abs().mean() < 0.05
+
+
+def test_reserve_cpu_threads_shrinks_and_restores_torch_pool(extractor, monkeypatch):
+    monkeypatch.setattr(fe_module.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(torch, "get_num_threads", lambda: 8)
+    calls = []
+    monkeypatch.setattr(torch, "set_num_threads", calls.append)
+
+    with extractor.reserve_cpu_threads(3):
+        assert calls == [5]
+    assert calls == [5, 8]
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from .. import _scoring
+from ..similarity_search import SimilaritySearchEngine
+from .test_similarity_search import create_product
+
+
+def unit_rows(rng, count, dim):
+    matrix = rng.standard_normal((count, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_numba_kernels_are_active():
+    assert _scoring.NUMBA_AVAILABLE
+
+
+@pytest.mark.parametrize("count,k", [(1, 1), (5, 10), (300, 1), (300, 7), (1000, 50)])
+def test_top_k_early_abort_matches_top_k_rows(count, k):
+    rng = np.random.default_rng(count + k)
+    matrix = unit_rows(rng, count, 32)
+    query = unit_rows(rng, 1, 32)[0]
+
+    rows, scores = _scoring.top_k_early_abort(matrix, query, k)
+
+    exact = matrix @ query
+    expected = _scoring.top_k_rows(exact, k)
+    assert np.allclose(scores, exact[rows], atol=1e-5)
+    assert np.allclose(scores, exact[expected], atol=1e-5)
+    assert set(rows.tolist()) == set(expected.tolist())
+
+
+@pytest.mark.parametrize("count", [1, 63, 64, 65, 200])
+def test_count_at_least_pdx_matches_count_nonzero(count):
+    rng = np.random.default_rng(count)
+    matrix = unit_rows(rng, count, 16)
+    query = unit_rows(rng, 1, 16)[0]
+    blocks = _scoring.to_pdx(matrix)
+
+    for threshold in (-1.0, 0.0, 0.3, 0.9):
+        expected = np.count_nonzero(matrix @ query >= threshold)
+        assert _scoring.count_at_least(matrix, query, threshold) == expected
+        assert _scoring.count_at_least_pdx(blocks, count, query, threshold) == expected
+
+
+def test_pdx_single_row_updates_and_swap_removes_match_matrix():
+    rng = np.random.default_rng(9)
+    rows = list(unit_rows(rng, 60, 16))
+    extra = unit_rows(rng, 20, 16)
+    query = unit_rows(rng, 1, 16)[0]
+    blocks = _scoring.to_pdx(np.array(rows))
+
+    # Appends cross the 64-row block boundary and force the block array to grow.
+    for vector in extra:
+        blocks = _scoring.pdx_set_row(blocks, len(rows), vector)
+        rows.append(vector)
+    # 76 is the last row by the time it is removed, so its lane is only zeroed.
+    for row in (0, 63, 64, 76, 5):
+        last = len(rows) - 1
+        _scoring.pdx_move_row(blocks, last, row)
+        rows[row] = rows[last]
+        rows.pop()
+
+    matrix = np.array(rows)
+    assert np.array_equal(_scoring.to_pdx(matrix), blocks[: -(-len(rows) // _scoring.PDX_BLOCK)])
+    for threshold in (0.0, 0.2, 0.6):
+        expected = np.count_nonzero(matrix @ query >= threshold)
+        assert _scoring.count_at_least_pdx(blocks, len(rows), query, threshold) == expected
+
+
+def test_engine_exact_scan_uses_kernels_through_adds_and_removes():
+    rng = np.random.default_rng(10)
+    vectors = unit_rows(rng, 150, 16)
+    engine = SimilaritySearchEngine(feature_dim=16)
+    assert engine._pdx_enabled
+    engine.add_products([create_product(idx) for idx in range(100)], vectors[:100])
+    engine.count_matches(vectors[3], 0.7)
+    for idx in range(100, 150):
+        engine.add_product(create_product(idx), vectors[idx])
+    for idx in (0, 63, 64, 149, 3):
+        engine.remove_product(f"prod_{idx}")
+
+    matrix = engine.feature_matrix
+    for idx in (7, 100, 148):
+        query = vectors[idx]
+        cosine = matrix @ query
+        top = engine.search(query, top_k=5)
+        expected = _scoring.top_k_rows(cosine, 5)
+        assert [result.product.id for result in top][0] == f"prod_{idx}"
+        assert np.allclose(
+            sorted(result.similarity_score for result in top),
+            sorted(((cosine[expected] + 1) / 2).tolist()),
+            atol=1e-5,
+        )
+        for threshold in (0.5, 0.75):
+            assert engine.count_matches(query, threshold) == np.count_nonzero(cosine >= threshold * 2 - 1)
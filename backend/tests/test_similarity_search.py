@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import os
+
 import numpy as np
 import pytest
 
@@ -30,6 +32,40 @@ def test_search_returns_sorted_results():
     assert all(results[i].similarity_score >= results[i + 1].similarity_score for i in range(len(results) - 1))
 
 
+def test_exact_scan_best_match_and_top_k_agree():
+    rng = np.random.default_rng(5)
+    vectors = rng.standard_normal((50, 6)).astype(np.float32)
+    engine = SimilaritySearchEngine(feature_dim=6)
+    engine.add_products([create_product(idx) for idx in range(50)], vectors)
+
+    for query in rng.standard_normal((5, 6)).astype(np.float32):
+        (best,) = engine.search(query, top_k=1)
+        assert best == engine.search(query, top_k=5)[0]
+
+
+def test_search_payload_reuses_serialized_products():
+    serialized = []
+
+    def serializer(product: Product) -> dict:
+        serialized.append(product.id)
+        return {"id": product.id, "name": product.name}
+
+    engine = SimilaritySearchEngine(feature_dim=3, product_serializer=serializer)
+    for idx, vec in enumerate(np.eye(3, dtype=np.float32)):
+        engine.add_product(create_product(idx), vec)
+    query = np.array([0.9, 0.1, 0.0], dtype=np.float32)
+
+    payload = engine.search_payload(query, top_k=2)
+    assert [item["product"]["id"] for item in payload] == [r.product.id for r in engine.search(query, top_k=2)]
+    assert payload[0]["similarity_score"] == engine.search(query, top_k=1)[0].similarity_score
+    assert engine.search_payload(query, top_k=2)[0]["product"] is payload[0]["product"]
+    assert serialized == ["prod_0", "prod_1"]
+
+    renamed = Product(id="prod_0", name="Renamed", image_path="data/catalog/prod_0.jpg")
+    engine.add_product(renamed, np.array([1.0, 0.0, 0.0], dtype=np.float32))
+    assert engine.search_payload(query, top_k=1)[0]["product"]["name"] == "Renamed"
+
+
 @pytest.mark.parametrize(
     "threshold,expected_count",
         [
@@ -51,3 +87,521 @@ def test_count_matches_respects_threshold(threshold, expected_count):
 
     query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
     assert engine.count_matches(query, threshold) == expected_count
+
+
+def test_count_matches_tracks_matrix_through_growth_and_removals():
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((150, 8)).astype(np.float32)
+    engine = SimilaritySearchEngine(feature_dim=8)
+    for idx, vec in enumerate(vectors):
+        engine.add_product(create_product(idx), vec)
+    removed = set(range(0, 150, 3))
+    for idx in removed:
+        engine.remove_product(f"prod_{idx}")
+
+    kept = np.array([vec for idx, vec in enumerate(vectors) if idx not in removed])
+    kept /= np.linalg.norm(kept, axis=1, keepdims=True)
+    query = vectors[1] / np.linalg.norm(vectors[1])
+    cosine = kept @ query
+    for threshold in (0.0, 0.6, 0.8):
+        assert engine.count_matches(vectors[1], threshold) == np.count_nonzero(cosine >= threshold * 2 - 1)
+
+
+def test_pdx_counts_stay_in_sync_with_matrix():
+    rng = np.random.default_rng(8)
+    vectors = rng.standard_normal((140, 8)).astype(np.float32)
+    engine = SimilaritySearchEngine(feature_dim=8)
+    engine._pdx_enabled = True
+    engine.add_products([create_product(idx) for idx in range(100)], vectors[:100])
+    query = vectors[5]
+
+    engine.count_matches(query, 0.6)
+    assert engine._pdx is not None
+    for idx in range(100, 140):
+        engine.add_product(create_product(idx), vectors[idx])
+    for idx in (0, 63, 64, 139, 5):
+        engine.remove_product(f"prod_{idx}")
+
+    matrix = engine.feature_matrix
+    normalized = engine._normalize_rows(query[None])[0]
+    for threshold in (0.0, 0.55, 0.7):
+        expected = np.count_nonzero(matrix @ normalized >= threshold * 2 - 1)
+        assert engine.count_matches(query, threshold) == expected
+
+
+def test_normalize_rows_returns_owned_unit_rows():
+    raw = np.array([[3.0, 4.0, 0.0], [0.0, 0.0, 0.0]], dtype=np.float64)
+    original = raw.copy()
+
+    normalized = SimilaritySearchEngine._normalize_rows(raw)
+
+    assert normalized.dtype == np.float32 and normalized.flags["C_CONTIGUOUS"]
+    assert np.allclose(normalized, [[0.6, 0.8, 0.0], [0.0, 0.0, 0.0]])
+    assert np.array_equal(raw, original)
+    unit = normalized[:1].copy()
+    assert not np.shares_memory(SimilaritySearchEngine._normalize_rows(unit), unit)
+
+
+def test_normalize_query_reuses_a_per_thread_buffer():
+    import threading
+
+    first = SimilaritySearchEngine._normalize_query(np.array([3.0, 4.0, 0.0]))
+    assert np.allclose(first, [[0.6, 0.8, 0.0]])
+    second = SimilaritySearchEngine._normalize_query(np.array([0.0, 2.0, 0.0], dtype=np.float32))
+    assert second is first and np.allclose(second, [[0.0, 1.0, 0.0]])
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(SimilaritySearchEngine._normalize_query(np.ones(3))))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_bulk_removals_keep_catalog_order_and_allow_re_adding():
+    engine = SimilaritySearchEngine(feature_dim=4)
+    vectors = np.eye(4, dtype=np.float32).repeat(3, axis=0)[:10]
+    engine.add_products([create_product(idx) for idx in range(10)], vectors)
+
+    for idx in (1, 4, 5, 9):
+        engine.remove_product(f"prod_{idx}")
+    engine.add_product(create_product(4), vectors[4], position="front")
+
+    assert [p.id for p in engine.products] == ["prod_4", "prod_0", "prod_2", "prod_3", "prod_6", "prod_7", "prod_8"]
+    assert engine.get_catalog_size() == 7
+
+
+def test_int8_index_reranks_with_exact_scores():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, 16)).astype(np.float32)
+    flat = SimilaritySearchEngine(feature_dim=16)
+    quantized = SimilaritySearchEngine(feature_dim=16, quantize_int8=True)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    flat.add_products(products, vectors)
+    quantized.add_products(products, vectors)
+
+    query = rng.standard_normal(16).astype(np.float32)
+    expected = flat.search(query, top_k=5)
+    results = quantized.search(query, top_k=5)
+
+    assert [r.product.id for r in results] == [r.product.id for r in expected]
+    assert np.allclose(
+        [r.similarity_score for r in results],
+        [r.similarity_score for r in expected],
+        atol=1e-5,
+    )
+
+
+def test_add_products_keeps_last_duplicate_and_replaces_existing():
+    engine = SimilaritySearchEngine(feature_dim=3)
+    engine.add_product(create_product(0), np.array([0.0, 0.0, 1.0], dtype=np.float32))
+    vectors = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 3.0, 0.0]], dtype=np.float32)
+    engine.add_products([create_product(0), create_product(1), create_product(1)], vectors)
+
+    assert engine.get_catalog_size() == 2
+    assert engine.index.ntotal == 2
+    assert engine.search(np.array([1.0, 0.0, 0.0], dtype=np.float32), top_k=1)[0].product.id == "prod_0"
+    assert np.allclose(engine.get_feature_vector("prod_1"), [0.0, 1.0, 0.0])
+
+
+def test_load_index_rejects_mismatched_layout(tmp_path):
+    engine = SimilaritySearchEngine(feature_dim=3)
+    engine.add_product(create_product(0), np.array([1.0, 0.0, 0.0], dtype=np.float32))
+    engine.save_index(str(tmp_path / "catalog_index"))
+
+    with pytest.raises(ValueError):
+        SimilaritySearchEngine(feature_dim=3, quantize_int8=True).load_index(str(tmp_path / "catalog_index"))
+
+
+def test_binary_prefilter_reranks_and_survives_save_load(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((200, 32)).astype(np.float32)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    engine = SimilaritySearchEngine(feature_dim=32, binary_prefilter=True, rerank_oversample=200)
+    engine.add_products(products, vectors)
+    engine.remove_product("prod_7")
+
+    query = vectors[7] + 0.05 * rng.standard_normal(32).astype(np.float32)
+    results = engine.search(query, top_k=3)
+    assert "prod_7" not in [r.product.id for r in results]
+    assert engine.binary_index.ntotal == engine.index.ntotal == 199
+
+    engine.save_index(str(tmp_path / "catalog_index"))
+    restored = SimilaritySearchEngine(feature_dim=32, binary_prefilter=True, rerank_oversample=200)
+    restored.load_index(str(tmp_path / "catalog_index"))
+    assert (tmp_path / "catalog_index.bin").exists()
+    assert [r.product.id for r in restored.search(query, top_k=3)] == [r.product.id for r in results]
+
+    flat = SimilaritySearchEngine(feature_dim=32)
+    flat.load_index(str(tmp_path / "catalog_index"))
+    assert [r.product.id for r in flat.search(query, top_k=3)] == [r.product.id for r in results]
+
+
+def test_exact_scan_matches_faiss_search():
+    rng = np.random.default_rng(2)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    scanned = SimilaritySearchEngine(feature_dim=8)
+    via_faiss = SimilaritySearchEngine(feature_dim=8, exact_scan_max_size=0)
+    scanned.add_products(products, vectors)
+    via_faiss.add_products(products, vectors)
+
+    query = rng.standard_normal(8).astype(np.float32)
+    expected = via_faiss.search(query, top_k=7)
+    results = scanned.search(query, top_k=7)
+
+    assert [r.product.id for r in results] == [r.product.id for r in expected]
+    assert np.allclose(
+        [r.similarity_score for r in results],
+        [r.similarity_score for r in expected],
+        atol=1e-6,
+    )
+    assert len(scanned.search(query, top_k=500)) == 50
+
+
+def test_remove_product_swaps_rows_and_round_trips_through_cache(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    engine = SimilaritySearchEngine(feature_dim=4)
+    engine.add_products([create_product(idx) for idx in range(4)], vectors)
+    engine.remove_product("prod_1")
+
+    assert engine.feature_matrix.shape == (3, 4)
+    assert np.allclose(engine.get_feature_vector("prod_3"), vectors[3])
+    assert engine.count_matches(vectors[1], 0.75) == 0
+
+    base = str(tmp_path / "catalog_index")
+    engine.save_index(base)
+    restored = SimilaritySearchEngine(feature_dim=4)
+    restored.load_index(base)
+    restored.remove_product("prod_0")
+    restored.add_product(create_product(9), np.array([0.0, 1.0, 0.0, 0.0], dtype=np.float32))
+    restored.save_index(base)
+
+    reloaded = SimilaritySearchEngine(feature_dim=4)
+    reloaded.load_index(base)
+    assert [p.id for p in reloaded.products] == ["prod_2", "prod_3", "prod_9"]
+    assert restored._index_mapped is False
+    assert reloaded.search(vectors[1], top_k=1)[0].product.id == "prod_9"
+    assert reloaded.search(vectors[3], top_k=1)[0].product.id == "prod_3"
+
+
+@pytest.mark.parametrize("quantize_int8", [False, True])
+def test_save_over_loaded_cache_releases_mappings_first(tmp_path, monkeypatch, quantize_int8):
+    from .. import similarity_search
+
+    vectors = np.eye(4, dtype=np.float32)
+    base = str(tmp_path / "catalog_index")
+    engine = SimilaritySearchEngine(feature_dim=4, quantize_int8=quantize_int8)
+    engine.add_products([create_product(idx) for idx in range(4)], vectors)
+    engine.save_index(base)
+
+    restored = SimilaritySearchEngine(feature_dim=4, quantize_int8=quantize_int8)
+    restored.load_index(base)
+    restored.remove_product("prod_0")
+    restored.add_product(create_product(9), np.array([0.0, 1.0, 0.0, 1.0], dtype=np.float32))
+    real_replace = os.replace
+
+    def replace(source, target):
+        # Windows raises PermissionError when replacing a file that is still mapped.
+        matrix = restored._matrix
+        while matrix is not None and not isinstance(matrix, np.memmap):
+            matrix = matrix.base
+        assert not restored._index_mapped and matrix is None, f"{target} is still mapped"
+        real_replace(source, target)
+
+    monkeypatch.setattr(similarity_search.os, "replace", replace)
+    restored.save_index(base)
+    monkeypatch.undo()
+
+    reloaded = SimilaritySearchEngine(feature_dim=4, quantize_int8=quantize_int8)
+    reloaded.load_index(base)
+    assert [p.id for p in reloaded.products] == [p.id for p in restored.products]
+    assert np.array_equal(reloaded.feature_matrix, restored.feature_matrix)
+    assert reloaded.search(vectors[3], top_k=1)[0].product.id == "prod_3"
+    assert reloaded.search(np.array([0.0, 1.0, 0.0, 1.0], dtype=np.float32), top_k=1)[0].product.id == "prod_9"
+
+
+def test_faiss_hits_resolve_through_dense_row_table_after_swaps():
+    vectors = np.eye(4, dtype=np.float32)
+    engine = SimilaritySearchEngine(feature_dim=4, exact_scan_max_size=0)
+    engine.add_products([create_product(idx) for idx in range(4)], vectors)
+    engine.remove_product("prod_0")
+    engine.add_product(create_product(7), vectors[0])
+
+    assert engine._faiss_id_rows[engine.product_id_to_faiss_id["prod_3"]] == 0
+    assert engine._faiss_id_rows[:5].tolist() == [-1, 1, 2, 0, 3]
+    assert engine._row_faiss_ids[: len(engine.products)].tolist() == [3, 1, 2, 4]
+    assert engine.product_id_to_faiss_id == {"prod_3": 3, "prod_1": 1, "prod_2": 2, "prod_7": 4}
+    for product_id, vector in [("prod_3", vectors[3]), ("prod_7", vectors[0])]:
+        assert engine.search(vector, top_k=1)[0].product.id == product_id
+    assert {result.product.id for result in engine.search(vectors[0], top_k=10)} == {
+        "prod_1",
+        "prod_2",
+        "prod_3",
+        "prod_7",
+    }
+
+
+@pytest.mark.parametrize("exact_scan_max_size", [0, 10_000])
+def test_batched_search_matches_single_queries(exact_scan_max_size):
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((40, 8)).astype(np.float32)
+    engine = SimilaritySearchEngine(feature_dim=8, exact_scan_max_size=exact_scan_max_size)
+    engine.add_products([create_product(idx) for idx in range(40)], vectors)
+
+    queries = vectors[:3] + 0.1 * rng.standard_normal((3, 8)).astype(np.float32)
+    top_ks, thresholds = [1, 5, 40], [0.5, 0.6, 0.0]
+    batched = engine.search_payload_batch_with_count(queries, top_ks, thresholds)
+    for (payload, total), query, top_k, threshold in zip(batched, queries, top_ks, thresholds):
+        expected, expected_total = engine.search_payload_with_count(query, top_k=top_k, min_similarity=threshold)
+        assert total == expected_total
+        assert [hit["product"]["id"] for hit in payload] == [hit["product"]["id"] for hit in expected]
+        # A GEMM and per-query GEMVs may round the last bit differently.
+        assert [hit["similarity_score"] for hit in payload] == pytest.approx(
+            [hit["similarity_score"] for hit in expected]
+        )
+
+
+def test_metadata_is_json_and_legacy_pickle_caches_still_load(tmp_path):
+    import json
+    import pickle
+
+    engine = SimilaritySearchEngine(feature_dim=3)
+    engine.add_products([create_product(idx) for idx in range(3)], np.eye(3, dtype=np.float32))
+    base = tmp_path / "catalog_index"
+    engine.save_index(str(base))
+
+    metadata = json.loads((tmp_path / "catalog_index.meta.json").read_text())
+    assert [p["id"] for p in metadata["products"]] == ["prod_0", "prod_1", "prod_2"]
+    restored = SimilaritySearchEngine(feature_dim=3)
+    restored.load_index(str(base))
+    assert restored.products == engine.products
+
+    metadata["products"] = engine.products
+    (tmp_path / "catalog_index.meta.json").unlink()
+    with open(tmp_path / "catalog_index.pkl", "wb") as f:
+        pickle.dump(metadata, f)
+    assert SimilaritySearchEngine.has_cached_index(str(base))
+    legacy = SimilaritySearchEngine(feature_dim=3)
+    legacy.load_index(str(base))
+    assert legacy.search(np.array([0.0, 1.0, 0.0], dtype=np.float32), top_k=1)[0].product.id == "prod_1"
+
+
+def test_fp16_matrix_scores_close_to_fp32(tmp_path):
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((2500, 16)).astype(np.float32)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    full = SimilaritySearchEngine(feature_dim=16)
+    half = SimilaritySearchEngine(feature_dim=16, store_fp16=True)
+    full.add_products(products, vectors)
+    half.add_products(products, vectors)
+
+    assert half.feature_matrix.dtype == np.float16
+    query = vectors[42]
+    assert half.search(query, top_k=1)[0].product.id == "prod_42"
+    assert np.allclose(
+        [r.similarity_score for r in half.search(query, top_k=10)],
+        [r.similarity_score for r in full.search(query, top_k=10)],
+        atol=2e-3,
+    )
+
+    base = str(tmp_path / "catalog_index")
+    full.save_index(base)
+    converted = SimilaritySearchEngine(feature_dim=16, store_fp16=True)
+    converted.load_index(base)
+    assert converted.feature_matrix.dtype == np.float16
+    assert converted.search(query, top_k=1)[0].product.id == "prod_42"
+
+
+def test_int8_matrix_scores_close_to_fp32(tmp_path):
+    rng = np.random.default_rng(5)
+    vectors = rng.standard_normal((300, 32)).astype(np.float32)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    full = SimilaritySearchEngine(feature_dim=32)
+    quantized = SimilaritySearchEngine(feature_dim=32, store_int8=True)
+    full.add_products(products, vectors)
+    quantized.add_products(products, vectors)
+    quantized.remove_product("prod_0")
+    full.remove_product("prod_0")
+
+    assert quantized.feature_matrix.dtype == np.int8
+    query = vectors[42]
+    assert quantized.search(query, top_k=1)[0].product.id == "prod_42"
+    assert np.allclose(
+        [r.similarity_score for r in quantized.search(query, top_k=5)],
+        [r.similarity_score for r in full.search(query, top_k=5)],
+        atol=1e-2,
+    )
+    assert quantized.count_matches(query, 0.6) == full.count_matches(query, 0.6)
+
+    base = str(tmp_path / "catalog_index")
+    quantized.save_index(base)
+    reloaded = SimilaritySearchEngine(feature_dim=32, store_int8=True)
+    reloaded.load_index(base)
+    assert np.array_equal(reloaded.row_scales, quantized.row_scales)
+    assert reloaded.search(query, top_k=1)[0].product.id == "prod_42"
+    widened = SimilaritySearchEngine(feature_dim=32)
+    widened.load_index(base)
+    assert widened.feature_matrix.dtype == np.float32
+    assert np.allclose(widened.get_feature_vector("prod_7"), quantized.get_feature_vector("prod_7"))
+
+
+def test_large_bulk_load_switches_to_ivfpq_and_reloads(tmp_path):
+    rng = np.random.default_rng(4)
+    vectors = rng.standard_normal((1000, 8)).astype(np.float32)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    engine = SimilaritySearchEngine(feature_dim=8, ivfpq_min_size=500, nprobe=32)
+    engine.add_products(products, vectors)
+
+    assert engine.index_kind == "ivfpq"
+    results = engine.search(vectors[5], top_k=3)
+    assert results[0].product.id == "prod_5"
+    assert results[0].similarity_score == pytest.approx(1.0, abs=1e-5)
+
+    base = str(tmp_path / "catalog_index")
+    engine.save_index(base)
+    restored = SimilaritySearchEngine(feature_dim=8, ivfpq_min_size=500, nprobe=32)
+    restored.load_index(base)
+    assert restored.index_kind == "ivfpq"
+    assert restored.search(vectors[5], top_k=1)[0].product.id == "prod_5"
+    with pytest.raises(ValueError):
+        SimilaritySearchEngine(feature_dim=8).load_index(base)
+
+
+def test_ivfpq_removals_keep_ids_aligned_across_reload(tmp_path):
+    rng = np.random.default_rng(5)
+    vectors = rng.standard_normal((400, 8)).astype(np.float32)
+    products = [create_product(idx) for idx in range(len(vectors))]
+    engine = SimilaritySearchEngine(feature_dim=8, ivfpq_min_size=200, nprobe=32, rerank_oversample=1)
+    engine.add_products(products, vectors)
+    assert engine.index_kind == "ivfpq"
+
+    def self_matches(target, removed):
+        kept = [idx for idx in range(len(vectors)) if idx not in removed]
+        return sum(target.search(vectors[idx], top_k=1)[0].product.id == f"prod_{idx}" for idx in kept), len(kept)
+
+    engine.remove_product("prod_3")
+    found, total = self_matches(engine, {3})
+    assert found >= 0.9 * total
+    for idx in (10, 11, 200, 399):
+        engine.remove_product(f"prod_{idx}")
+    removed = {3, 10, 11, 200, 399}
+    assert engine.index.ntotal == len(vectors) - len(removed)
+    assert all(result.product.id != "prod_10" for result in engine.search(vectors[10], top_k=5))
+
+    base = str(tmp_path / "catalog_index")
+    engine.save_index(base)
+    restored = SimilaritySearchEngine(feature_dim=8, ivfpq_min_size=200, nprobe=32, rerank_oversample=1)
+    restored.load_index(base)
+    restored.remove_product("prod_50")
+    removed.add(50)
+    found, total = self_matches(restored, removed)
+    assert found >= 0.9 * total
+
+
+@pytest.mark.parametrize("exact_scan_limit", [10_000, 0])
+def test_search_applies_min_similarity(exact_scan_limit):
+    engine = SimilaritySearchEngine(feature_dim=3, exact_scan_max_size=exact_scan_limit)
+    vectors = np.array([[1.0, 0.0, 0.0], [0.8, 0.2, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+    engine.add_products([create_product(idx) for idx in range(3)], vectors)
+
+    results = engine.search(np.array([1.0, 0.0, 0.0], dtype=np.float32), top_k=3, min_similarity=0.75)
+
+    assert [r.product.id for r in results] == ["prod_0", "prod_1"]
+
+
+@pytest.mark.parametrize("exact_scan_limit,quantize_int8", [(10_000, False), (0, False), (0, True)])
+@pytest.mark.parametrize("threshold", [0.0, 0.55, 0.9])
+def test_search_with_count_matches_separate_calls(exact_scan_limit, quantize_int8, threshold):
+    rng = np.random.default_rng(6)
+    vectors = rng.standard_normal((200, 8)).astype(np.float32)
+    engine = SimilaritySearchEngine(
+        feature_dim=8,
+        quantize_int8=quantize_int8,
+        exact_scan_max_size=exact_scan_limit,
+    )
+    engine.add_products([create_product(idx) for idx in range(len(vectors))], vectors)
+    query = vectors[11]
+
+    results, total = engine.search_with_count(query, top_k=5, min_similarity=threshold)
+
+    expected = engine.search(query, top_k=5, min_similarity=threshold)
+    assert [r.product.id for r in results] == [r.product.id for r in expected]
+    assert total == engine.count_matches(query, threshold)
+    payload, payload_total = engine.search_payload_with_count(query, top_k=5, min_similarity=threshold)
+    assert [item["product"]["id"] for item in payload] == [r.product.id for r in expected]
+    assert payload_total == total
+
+
+def test_faiss_simd_level_falls_back_to_compile_options(monkeypatch):
+    from .. import similarity_search
+
+    monkeypatch.delattr(similarity_search.faiss, "SIMDConfig", raising=False)
+    monkeypatch.setattr(similarity_search.faiss, "get_compile_options", lambda: "OPTIMIZE AVX2 ")
+    assert similarity_search._faiss_simd_level() == "AVX2"
+    monkeypatch.setattr(similarity_search.faiss, "get_compile_options", lambda: "OPTIMIZE ")
+    assert similarity_search._faiss_simd_level() == "generic"
+
+
+def test_directory_build_bounds_decodes_in_flight(tmp_path, monkeypatch):
+    import threading
+
+    import cv2
+
+    from .. import similarity_search
+
+    for idx in range(9):
+        cv2.imwrite(str(tmp_path / f"prod_{idx}.png"), np.full((4, 4, 3), idx, dtype=np.uint8))
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+    decode = similarity_search.decode_image_bgr
+
+    def tracked_decode(contents):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            return decode(contents)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    monkeypatch.setattr(similarity_search, "decode_image_bgr", tracked_decode)
+
+    class Extractor:
+        def extract_features_batch(self, images, out=None, bgr=False):
+            out[: len(images)] = [[float(image[0, 0, 0]) + 1.0, 1.0, 0.0] for image in images]
+            return out[: len(images)]
+
+    engine = SimilaritySearchEngine(feature_dim=3)
+    engine.build_index_from_directory(tmp_path, Extractor(), batch_size=2, max_workers=8)
+    assert peak[0] <= 4
+    assert sorted(p.id for p in engine.products) == [f"prod_{idx}" for idx in range(9)]
+
+
+@pytest.mark.parametrize("quantize_int8", [False, True])
+def test_loaded_index_is_mapped_until_first_mutation(tmp_path, quantize_int8):
+    from .. import similarity_search
+
+    if similarity_search._MMAP_INDEX_FLAG is None:
+        pytest.skip("FAISS build cannot memory-map flat indexes")
+    vectors = np.eye(4, dtype=np.float32)
+    engine = SimilaritySearchEngine(feature_dim=4, quantize_int8=quantize_int8)
+    engine.add_products([create_product(idx) for idx in range(4)], vectors)
+    base = str(tmp_path / "catalog_index")
+    engine.save_index(base)
+
+    restored = SimilaritySearchEngine(feature_dim=4, quantize_int8=quantize_int8)
+    restored.load_index(base)
+    assert restored._index_mapped is True
+    assert restored.search(vectors[2], top_k=1)[0].product.id == "prod_2"
+    # Saving over the mapped file swaps it in rather than truncating pages still in use.
+    restored.save_index(base)
+    assert restored.search(vectors[1], top_k=1)[0].product.id == "prod_1"
+
+    restored.add_product(create_product(7), np.array([1.0, 1.0, 0.0, 0.0], dtype=np.float32))
+    restored.remove_product("prod_0")
+    assert restored._index_mapped is False
+    assert restored.index.ntotal == 4
+    assert restored.search(vectors[3], top_k=1)[0].product.id == "prod_3"
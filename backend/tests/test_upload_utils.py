@@ -24,10 +24,10 @@ class DummyUpload:
 class DummyExtractor:
     def __init__(self, output: np.ndarray):
         self._output = output
-        self.calls: list[np.ndarray] = []
+        self.calls: list[dict] = []
 
-    def extract_features(self, image: np.ndarray) -> np.ndarray:
-        self.calls.append(image)
+    def extract_query_ensemble(self, image: np.ndarray, **kwargs) -> np.ndarray:
+        self.calls.append({"image": image, **kwargs})
         return self._output
 
 
@@ -51,10 +51,17 @@ def test_parse_similarity_threshold_invalid(value):
         upload_utils.parse_similarity_threshold(value)
 
 
-def test_build_query_features_averages_variants():
+@pytest.mark.parametrize(
+    "use_flip,use_crop,expected_crop",
+    [
+        (True, True, 0.5),
+        (False, False, None),
+    ],
+)
+def test_build_query_features_uses_single_ensemble_call(use_flip, use_crop, expected_crop):
     config = AppConfig(
-        query_use_horizontal_flip=True,
-        query_use_center_crop=True,
+        query_use_horizontal_flip=use_flip,
+        query_use_center_crop=use_crop,
         query_crop_ratio=0.5,
     )
     image = np.ones((4, 4, 3), dtype=np.uint8)
@@ -64,8 +71,9 @@ def test_build_query_features_averages_variants():
     features = upload_utils.build_query_features(image, extractor, config)
 
     assert np.allclose(features, expected_vector)
-    # Horizontal flip + crop variants => 3 calls in total
-    assert len(extractor.calls) == 3
+    assert len(extractor.calls) == 1
+    assert extractor.calls[0]["horizontal_flip"] is use_flip
+    assert extractor.calls[0]["crop_ratio"] == expected_crop
 
 
 def test_decode_upload_image_rejects_invalid_data():
@@ -80,3 +88,68 @@ def test_decode_upload_image_rejects_invalid_data():
 
     with pytest.raises(HTTPException):
         asyncio.run(call_decode())
+
+
+@pytest.mark.parametrize("extension,content_type", [(".jpg", "image/jpeg"), (".png", "image/png")])
+def test_decode_upload_image_returns_rgb(extension, content_type):
+    import cv2
+
+    bgr = np.zeros((8, 8, 3), dtype=np.uint8)
+    bgr[..., 2] = 255  # pure red in OpenCV's BGR layout
+    ok, encoded = cv2.imencode(extension, bgr)
+    assert ok
+    upload = DummyUpload(f"red{extension}", content_type, encoded.tobytes())
+
+    image = asyncio.run(
+        upload_utils.decode_upload_image(
+            upload,
+            failure_detail=upload_utils.UPLOAD_DECODE_ERROR,
+            failure_status=400,
+        )
+    )
+
+    assert image.shape == (8, 8, 3)
+    assert image[..., 0].min() > 240 and image[..., 2].max() < 15
+
+
+def test_encode_jpeg_rgb_keeps_channel_order():
+    import cv2
+
+    from ..utils.image_codecs import encode_jpeg_rgb
+
+    rgb = np.zeros((16, 16, 3), dtype=np.uint8)
+    rgb[..., 0] = 255  # pure red in RGB layout
+
+    decoded = cv2.imdecode(np.frombuffer(encode_jpeg_rgb(rgb), np.uint8), cv2.IMREAD_COLOR)
+
+    assert decoded.shape == (16, 16, 3)
+    assert decoded[..., 2].min() > 240 and decoded[..., 0].max() < 15
+
+
+@pytest.mark.parametrize("max_size,byte_threshold", [(1 << 20, 1 << 20), (16, 1 << 20), (16, 0)])
+def test_decode_upload_image_reads_spooled_file_in_place(monkeypatch, max_size, byte_threshold):
+    import cv2
+    from tempfile import SpooledTemporaryFile
+
+    from starlette.datastructures import Headers, UploadFile
+
+    monkeypatch.setattr(upload_utils, "MMAP_MIN_UPLOAD_BYTES", byte_threshold)
+    rgb = np.zeros((8, 8, 3), dtype=np.uint8)
+    rgb[..., 1] = 255
+    ok, encoded = cv2.imencode(".png", rgb)
+    assert ok
+    spooled = SpooledTemporaryFile(max_size=max_size)
+    spooled.write(encoded.tobytes())
+    spooled.seek(0)
+    upload = UploadFile(spooled, filename="green.png", headers=Headers({"content-type": "image/png"}))
+
+    image = asyncio.run(
+        upload_utils.decode_upload_image(
+            upload,
+            failure_detail=upload_utils.UPLOAD_DECODE_ERROR,
+            failure_status=400,
+        )
+    )
+
+    assert image.shape == (8, 8, 3)
+    assert image[..., 1].min() > 240 and image[..., 0].max() < 15
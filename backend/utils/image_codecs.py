@@ -0,0 +1,87 @@
+import logging
+import mmap
+from functools import lru_cache
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Anything exposing the buffer protocol; uploads may arrive as bytes, a memoryview, or an mmap.
+BytesLike = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+@lru_cache(maxsize=1)
+def get_turbojpeg():
+    """Return a shared TurboJPEG handle, or None when PyTurboJPEG/libturbojpeg is unavailable."""
+    try:
+        from turbojpeg import TurboJPEG
+
+        return TurboJPEG()
+    except Exception as exc:  # ImportError, or RuntimeError/OSError when the shared library is missing
+        logger.info("libjpeg-turbo unavailable, using OpenCV for JPEG coding: %s", exc)
+        return None
+
+
+def decode_jpeg_rgb(contents: BytesLike) -> Optional[np.ndarray]:
+    """Decode JPEG bytes straight to RGB with libjpeg-turbo; None if unavailable or undecodable."""
+    return _decode_turbojpeg(contents, "TJPF_RGB")
+
+
+def decode_jpeg_bgr(contents: BytesLike) -> Optional[np.ndarray]:
+    """Decode JPEG bytes to OpenCV's BGR layout with libjpeg-turbo; None if unavailable or undecodable."""
+    return _decode_turbojpeg(contents, "TJPF_BGR")
+
+
+def _decode_turbojpeg(contents: BytesLike, pixel_format: str) -> Optional[np.ndarray]:
+    jpeg = get_turbojpeg()
+    if jpeg is None:
+        return None
+    import turbojpeg
+
+    try:
+        return jpeg.decode(contents, pixel_format=getattr(turbojpeg, pixel_format))
+    except Exception:
+        return None
+
+
+def encode_jpeg_rgb(image: np.ndarray, quality: int = 95) -> bytes:
+    """Encode an HWC uint8 RGB image as JPEG, with libjpeg-turbo when available, else OpenCV."""
+    jpeg = get_turbojpeg()
+    if jpeg is not None:
+        from turbojpeg import TJPF_RGB
+
+        return jpeg.encode(image, quality=quality, pixel_format=TJPF_RGB)
+    ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode image as JPEG.")
+    return encoded.tobytes()
+
+
+def decode_jpeg_on_device(contents: BytesLike, device) -> Optional["torch.Tensor"]:
+    """
+    Decode JPEG bytes with nvJPEG into a CHW uint8 RGB tensor that stays on `device`;
+    None if torchvision's GPU decoder is unavailable or the payload is undecodable.
+    """
+    try:
+        import torch
+        from torchvision.io import ImageReadMode, decode_jpeg
+
+        data = torch.frombuffer(bytearray(contents), dtype=torch.uint8)
+        return decode_jpeg(data, mode=ImageReadMode.RGB, device=device)
+    except Exception:
+        return None
+
+
+def decode_image_rgb(contents: BytesLike) -> Optional[np.ndarray]:
+    """Decode arbitrary image bytes with OpenCV and convert to RGB; None if undecodable."""
+    image = decode_image_bgr(contents)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def decode_image_bgr(contents: BytesLike) -> Optional[np.ndarray]:
+    """Decode arbitrary image bytes with OpenCV in its native BGR layout; None if undecodable."""
+    return cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
@@ -1,15 +1,23 @@
-from typing import Optional
+import mmap
+import os
+from tempfile import SpooledTemporaryFile
+from typing import Optional, Union
 from pathlib import Path
 
 import numpy as np
-import cv2
+import torch
 from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 from ..config import AppConfig
 from ..feature_extractor import FeatureExtractor
+from .image_codecs import BytesLike, decode_image_rgb, decode_jpeg_on_device, decode_jpeg_rgb
 
 
 UPLOAD_DECODE_ERROR = "Unable to decode image. Please try another file."
+JPEG_CONTENT_TYPES = {"image/jpeg", "image/jpg", "image/pjpeg"}
+# Uploads spilled to disk at or above this size are memory-mapped instead of read into bytes.
+MMAP_MIN_UPLOAD_BYTES = 1 << 20
 
 
 def build_supported_formats_message(config: AppConfig) -> str:
@@ -37,44 +45,68 @@ async def decode_upload_image(
     *,
     failure_detail: str,
     failure_status: int,
-) -> np.ndarray:
-    contents = await upload.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    gpu_device: Optional[torch.device] = None,
+) -> Union[np.ndarray, torch.Tensor]:
+    """
+    Decode an upload to an RGB HWC uint8 array. With `gpu_device`, JPEGs are decoded by nvJPEG
+    and returned as a CHW uint8 tensor already resident on that device.
+    """
+    content_type = (upload.content_type or "").lower()
+    spooled = getattr(upload, "file", None)
+    # The decoders release the GIL, so concurrent uploads decode in parallel off the event loop.
+    if isinstance(spooled, SpooledTemporaryFile):
+        image = await run_in_threadpool(_decode_spooled, spooled, content_type, gpu_device)
+    else:
+        contents = await upload.read()
+        image = await run_in_threadpool(_decode_contents, contents, content_type, gpu_device)
     if image is None:
         raise HTTPException(status_code=failure_status, detail=failure_detail)
-    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-
-def build_query_variants(image: np.ndarray, config: AppConfig) -> list[np.ndarray]:
-    variants = [image]
-    if config.query_use_horizontal_flip:
-        variants.append(np.fliplr(image))
-    if config.query_use_center_crop:
-        crop_ratio = config.query_crop_ratio
-        h, w, _ = image.shape
-        ch = max(1, int(h * crop_ratio))
-        cw = max(1, int(w * crop_ratio))
-        top = max(0, (h - ch) // 2)
-        left = max(0, (w - cw) // 2)
-        cropped = image[top : top + ch, left : left + cw]
-        cropped = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LINEAR)
-        variants.append(cropped)
-    return variants
+    return image
+
+
+def _decode_spooled(
+    spooled: SpooledTemporaryFile,
+    content_type: str,
+    gpu_device: Optional[torch.device] = None,
+) -> Union[np.ndarray, torch.Tensor, None]:
+    """Decode straight from Starlette's spooled upload buffer instead of copying it into bytes."""
+    if not spooled._rolled:
+        with spooled._file.getbuffer() as view:
+            return _decode_contents(view, content_type, gpu_device)
+    if os.fstat(spooled.fileno()).st_size >= MMAP_MIN_UPLOAD_BYTES:
+        with mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _decode_contents(mapped, content_type, gpu_device)
+    spooled.seek(0)
+    return _decode_contents(spooled.read(), content_type, gpu_device)
+
+
+def _decode_contents(
+    contents: BytesLike,
+    content_type: str,
+    gpu_device: Optional[torch.device] = None,
+) -> Union[np.ndarray, torch.Tensor, None]:
+    image = None
+    if gpu_device is not None and content_type in JPEG_CONTENT_TYPES:
+        image = decode_jpeg_on_device(contents, gpu_device)
+    if image is None and content_type in JPEG_CONTENT_TYPES:
+        # libjpeg-turbo decodes straight to RGB, skipping OpenCV's BGR decode + cvtColor pass.
+        image = decode_jpeg_rgb(contents)
+    if image is None:
+        image = decode_image_rgb(contents)
+    return image
 
 
 def build_query_features(
-    image: np.ndarray,
+    image: Union[np.ndarray, torch.Tensor],
     extractor: FeatureExtractor,
     config: AppConfig,
 ) -> np.ndarray:
-    variants = build_query_variants(image, config)
-    feature_list = [extractor.extract_features(variant) for variant in variants]
-    query_features = np.mean(feature_list, axis=0)
-    norm = np.linalg.norm(query_features)
-    if norm > 0:
-        query_features = query_features / norm
-    return query_features
+    crop_ratio = config.query_crop_ratio if config.query_use_center_crop else None
+    return extractor.extract_query_ensemble(
+        image,
+        horizontal_flip=config.query_use_horizontal_flip,
+        crop_ratio=crop_ratio,
+    )
 
 
 def parse_positive_int(value, *, param_name: str) -> int:
@@ -3,10 +3,16 @@
 
 from __future__ import annotations
 
+import heapq
+import os
 import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import count, zip_longest
 from pathlib import Path
-from typing import Iterable
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 import sys
 
@@ -21,24 +27,144 @@ from scripts.utils.cli import (  # type: ignore
     positive_int,
 )
 from scripts.utils.io import download_binary, ensure_directory, fetch_text  # type: ignore
-from scripts.utils.retry import run_with_retry  # type: ignore
+from scripts.utils.retry import backoff_delay, run_with_retry  # type: ignore
 
 PASS_URL_LIST = "https://www.robots.ox.ac.uk/~vgg/research/pass/pass_urls.txt"
+# Sidecar of `url<TAB>file name<TAB>size` lines for every image this script has saved into the catalog.
+MANIFEST_NAME = ".downloaded.tsv"
+MANIFEST_SYNC_EVERY = 100
+# Consecutive final failures after which a host's jobs stop being retried.
+HOST_FAILURE_LIMIT = 5
 
 
-def iter_target_paths(out_dir: Path, prefix: str = "pass") -> Iterable[Path]:
-    existing = sorted(out_dir.glob(f"{prefix}_*.jpg"))
-    start_idx = 0
-    if existing:
-        last = existing[-1].stem
-        try:
-            start_idx = int(last.split("_")[1]) + 1
-        except Exception:
-            start_idx = len(existing)
-    idx = start_idx
-    while True:
-        yield out_dir / f"{prefix}_{idx:06d}.jpg"
-        idx += 1
+def next_target_index(out_dir: Path, prefix: str) -> int:
+    """One past the highest `{prefix}_<n>.jpg` index in `out_dir`, from a single scandir pass."""
+    head, tail = f"{prefix}_", ".jpg"
+    next_idx = 0
+    with os.scandir(out_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith(head) and name.endswith(tail):
+                digits = name[len(head) : -len(tail)]
+                if digits.isdigit():
+                    next_idx = max(next_idx, int(digits) + 1)
+    return next_idx
+
+
+def load_downloaded_urls(out_dir: Path) -> set[str]:
+    """URLs from the manifest whose file is still in `out_dir` with the recorded size."""
+    manifest = out_dir / MANIFEST_NAME
+    if not manifest.exists():
+        return set()
+    sizes: Dict[str, int] = {}
+    with os.scandir(out_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                sizes[entry.name] = entry.stat().st_size
+    downloaded = set()
+    for line in manifest.read_text(encoding="utf-8").splitlines():
+        fields = line.split("\t")
+        if len(fields) == 3 and fields[2].isdigit() and sizes.get(fields[1]) == int(fields[2]):
+            downloaded.add(fields[0])
+    return downloaded
+
+
+def interleave_by_host(jobs: List[Tuple[str, Path]]) -> List[Tuple[str, Path]]:
+    """
+    Order (url, dest) jobs round-robin across hosts, keeping each host's jobs in sample order. The
+    concurrent workers then spread their requests over every origin instead of all queueing on one,
+    and a worker that comes back to a host reuses the keep-alive connection it left in its pool.
+    """
+    by_host: Dict[str, List[Tuple[str, Path]]] = {}
+    for job in jobs:
+        by_host.setdefault(urlsplit(job[0]).netloc.lower(), []).append(job)
+    return [job for round_jobs in zip_longest(*by_host.values()) for job in round_jobs if job is not None]
+
+
+def run_downloads(
+    jobs: Iterable[Tuple[str, Path]],
+    *,
+    workers: int,
+    attempts: int,
+    delay: float,
+) -> Iterator[Tuple[str, Path, Optional[BaseException]]]:
+    """
+    Download (url, dest) jobs on `workers` threads, yielding (url, dest, error) once each job is final.
+
+    A failed job is re-queued with jittered exponential backoff instead of sleeping on its worker
+    thread, and its host cools off for the same time. New jobs for a cooling host wait in that host's
+    own queue, outside the admission budget, so workers keep pulling jobs for the other hosts
+    meanwhile. Once `HOST_FAILURE_LIMIT` jobs in a row have failed for good on a host, its remaining
+    jobs get a single attempt each until one succeeds, instead of burning the full retry budget on a
+    host that is down. At most two jobs per worker are in flight.
+    """
+    max_in_flight = 2 * workers
+    pending_jobs = iter(jobs)
+    jobs_left = True
+    # Heap of (ready_at, seq, url, dest, attempt) for failed jobs waiting out their backoff.
+    retries: List[Tuple[float, int, str, Path, int]] = []
+    # Fresh jobs held back while their host cools off, per host and in their original order.
+    deferred: Dict[str, Deque[Tuple[str, Path]]] = {}
+    host_ready_at: Dict[str, float] = {}
+    host_failures: Dict[str, int] = {}
+    order = count()
+    in_flight: Dict[Future, Tuple[str, Path, int]] = {}
+
+    def next_job(now: float) -> Optional[Tuple[str, Path, int]]:
+        nonlocal jobs_left
+        if retries and retries[0][0] <= now:
+            _, _, url, dest, attempt = heapq.heappop(retries)
+            return url, dest, attempt
+        for host, backlog in deferred.items():
+            if host_ready_at.get(host, 0.0) <= now:
+                url, dest = backlog.popleft()
+                if not backlog:
+                    del deferred[host]
+                return url, dest, 0
+        while jobs_left:
+            job = next(pending_jobs, None)
+            if job is None:
+                jobs_left = False
+                break
+            host = urlsplit(job[0]).netloc.lower()
+            if host in deferred or host_ready_at.get(host, 0.0) > now:
+                deferred.setdefault(host, deque()).append(job)
+                continue
+            return job[0], job[1], 0
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            now = time.monotonic()
+            while len(in_flight) < max_in_flight:
+                job = next_job(now)
+                if job is None:
+                    break
+                url, dest, attempt = job
+                in_flight[executor.submit(download_binary, url, dest, timeout=60)] = job
+            wake_times = [retries[0][0]] if retries else []
+            wake_times.extend(host_ready_at.get(host, 0.0) for host in deferred)
+            if not in_flight and not wake_times:
+                return
+            timeout = max(0.0, min(wake_times) - now) if wake_times else None
+            if not in_flight:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, dest, attempt = in_flight.pop(future)
+                error = future.exception()
+                host = urlsplit(url).netloc.lower()
+                if error is None:
+                    host_failures.pop(host, None)
+                elif attempt + 1 < attempts and host_failures.get(host, 0) < HOST_FAILURE_LIMIT:
+                    ready_at = time.monotonic() + backoff_delay(delay, attempt + 1)
+                    host_ready_at[host] = max(host_ready_at.get(host, 0.0), ready_at)
+                    heapq.heappush(retries, (ready_at, next(order), url, dest, attempt + 1))
+                    continue
+                else:
+                    host_failures[host] = host_failures.get(host, 0) + 1
+                yield url, dest, error
 
 
 def main() -> int:
@@ -62,7 +188,12 @@ def main() -> int:
         action="store_true",
         help="Disable SSL certificate validation when downloading pass_urls.txt",
     )
-    parser.add_argument("--workers", type=positive_int, default=8, help="Parallel download workers")
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=32,
+        help="Concurrent downloads (threads mostly wait on the network, so this can exceed the core count)",
+    )
     parser.add_argument(
         "--retry-attempts",
         type=positive_int,
@@ -73,7 +204,7 @@ def main() -> int:
         "--retry-delay",
         type=non_negative_float,
         default=1.5,
-        help="Seconds to wait between retries (0 disables the delay).",
+        help="Base retry delay in seconds; waits are jittered and double per attempt (0 disables the delay).",
     )
     parser.add_argument(
         "--dry-run",
@@ -82,21 +213,29 @@ def main() -> int:
     )
     args = parser.parse_args()
 
-    ensure_directory(args.out)
-
-    text = run_with_retry(
-        lambda: fetch_text(args.urls, insecure=args.insecure),
-        attempts=args.retry_attempts,
-        delay=args.retry_delay,
-    )
+    # The URL list is a multi-megabyte fetch; scan the output directory while it is in flight.
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        url_list = prefetch.submit(
+            run_with_retry,
+            lambda: fetch_text(args.urls, insecure=args.insecure),
+            attempts=args.retry_attempts,
+            delay=args.retry_delay,
+        )
+        ensure_directory(args.out)
+        start_idx = next_target_index(args.out, "pass")
+        downloaded = load_downloaded_urls(args.out)
+        text = url_list.result()
     urls = [line.strip() for line in text.splitlines() if line.strip()]
     if not urls:
         raise RuntimeError("No URLs found in PASS list.")
-    random.Random(args.seed).shuffle(urls)
-    selected = urls[: args.count]
+    if downloaded:
+        # Images saved by earlier runs are skipped, so --count always means new images.
+        urls = [url for url in urls if url not in downloaded]
+        print(f"Skipping {len(downloaded)} PASS images already in {args.out}.")
+    # sample() only draws --count entries instead of shuffling the whole ~1.4M-line list.
+    selected = random.Random(args.seed).sample(urls, min(args.count, len(urls)))
 
-    target_iter = iter_target_paths(args.out, prefix="pass")
-    targets = [next(target_iter) for _ in selected]
+    targets = [args.out / f"pass_{idx:06d}.jpg" for idx in range(start_idx, start_idx + len(selected))]
 
     if args.dry_run:
         print("Dry run: the following downloads would be scheduled:")
@@ -107,25 +246,21 @@ def main() -> int:
     print(f"Downloading {len(selected)} PASS images with {args.workers} workers...")
     successes = 0
 
-    def download_with_retry(url: str, dest: Path) -> None:
-        return run_with_retry(
-            lambda: download_binary(url, dest, timeout=60),
+    with open(args.out / MANIFEST_NAME, "a", encoding="utf-8") as manifest:
+        for url, dest, error in run_downloads(
+            interleave_by_host(list(zip(selected, targets))),
+            workers=args.workers,
             attempts=args.retry_attempts,
             delay=args.retry_delay,
-        )
-
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        future_to_url = {
-            executor.submit(download_with_retry, url, dest): (url, dest)
-            for url, dest in zip(selected, targets)
-        }
-        for future in as_completed(future_to_url):
-            url, _ = future_to_url[future]
-            try:
-                future.result()
-                successes += 1
-            except Exception as exc:
-                print(f"[error] download failed for {url}: {exc}")
+        ):
+            if error is not None:
+                print(f"[error] download failed for {url}: {error}")
+                continue
+            successes += 1
+            manifest.write(f"{url}\t{dest.name}\t{dest.stat().st_size}\n")
+            if successes % MANIFEST_SYNC_EVERY == 0:
+                manifest.flush()
+                os.fsync(manifest.fileno())
 
     print(f"Downloaded {successes}/{args.count} PASS images to {args.out}")
 
@@ -3,7 +3,7 @@
 
 from __future__ import annotations
 
-import importlib
+import importlib.util
 import re
 import shutil
 import subprocess
@@ -61,33 +61,76 @@ def run_pip(args: list[str], *, attempts: int, delay: float) -> None:
     def invoke() -> None:
         subprocess.check_call(cmd)
 
-    run_with_retry(invoke, attempts=attempts, delay=delay, exceptions=(subprocess.CalledProcessError,))
+    # A single installer process has no herd to spread out, so keep the documented fixed wait.
+    run_with_retry(
+        invoke, attempts=attempts, delay=delay, exceptions=(subprocess.CalledProcessError,), backoff="fixed"
+    )
 
 
-def current_variant() -> tuple[Optional[str], Optional[str], bool]:
+def current_variant() -> tuple[Optional[str], Optional[str]]:
+    """
+    (version, local build tag) of the installed torch, read from `torch/version.py` without importing
+    torch, which costs seconds of startup on the already-installed path. Wheel metadata is not enough:
+    PyPI CUDA wheels carry the `+cuXXX` tag only in `torch.__version__`.
+    """
+    spec = importlib.util.find_spec("torch")
+    if spec is None or not spec.submodule_search_locations:
+        return None, None
+    version_file = Path(next(iter(spec.submodule_search_locations))) / "version.py"
     try:
-        torch = importlib.import_module("torch")
-        version = getattr(torch, "__version__", "")
-        flavor = None
-        if "+" in version:
-            flavor = version.split("+", 1)[1]
-        has_cuda = torch.cuda.is_available()
-        return version, flavor, has_cuda
-    except ModuleNotFoundError:
-        return None, None, False
+        match = re.search(r"^__version__\s*=\s*['\"]([^'\"]+)['\"]", version_file.read_text(), re.MULTILINE)
+    except OSError:
+        match = None
+    if match is None:
+        return None, None
+    version = match.group(1)
+    flavor = version.split("+", 1)[1] if "+" in version else None
+    return version, flavor
 
 
 def detect_system_cuda_version() -> Optional[Tuple[int, int]]:
+    version = nvml_cuda_version()
+    if version is not None:
+        return version
     if shutil.which("nvidia-smi") is None:
         return None
     try:
         output = subprocess.check_output(["nvidia-smi"], text=True)
     except (subprocess.CalledProcessError, FileNotFoundError):
         return None
-    match = re.search(r"CUDA Version:\s*(\d+)\.(\d+)", output)
-    if not match:
+    return parse_smi_cuda_version(output)
+
+
+def parse_smi_cuda_version(output: str) -> Optional[Tuple[int, int]]:
+    """`(major, minor)` from the `CUDA Version: 12.4` field of the `nvidia-smi` banner."""
+    _, found, rest = output.partition("CUDA Version:")
+    if not found:
+        return None
+    major, _, minor = rest.lstrip().partition(".")
+    minor = minor[: len(minor) - len(minor.lstrip("0123456789"))]
+    if not major.isdigit() or not minor:
+        return None
+    return int(major), int(minor)
+
+
+def nvml_cuda_version() -> Optional[Tuple[int, int]]:
+    """Driver CUDA version through NVML (`nvidia-ml-py`) when installed; skips the slow `nvidia-smi` run."""
+    try:
+        import pynvml
+    except ImportError:
+        return None
+    try:
+        pynvml.nvmlInit()
+    except pynvml.NVMLError:
+        return None
+    try:
+        version = pynvml.nvmlSystemGetCudaDriverVersion_v2()
+    except pynvml.NVMLError:
         return None
-    return int(match.group(1)), int(match.group(2))
+    finally:
+        pynvml.nvmlShutdown()
+    # Encoded as 1000 * major + 10 * minor, e.g. 12040 for CUDA 12.4.
+    return version // 1000, (version % 1000) // 10
 
 
 def select_cuda_channel(cuda_version: Optional[Tuple[int, int]]) -> Optional[WheelChannel]:
@@ -130,6 +173,8 @@ def install_spec(channel: WheelChannel, spec: TorchWheelSpec, *, attempts: int,
         f"Installing PyTorch ({channel.label}) build "
         f"(torch=={spec.torch_version}, torchvision=={spec.torchvision_version})..."
     )
+    # Only the wheel channel is searched: the fallback chain relies on pip failing when a pinned release is
+    # missing there, and a PyPI extra index would satisfy the pin with a build of the wrong flavor.
     run_pip(
         [
             f"--index-url={channel.index_url}",
@@ -211,7 +256,7 @@ def main() -> int:
     desired_channel = None if args.force_cpu else select_cuda_channel(system_cuda)
     if not args.force_cpu and system_cuda and not desired_channel:
         print("Detected CUDA version %s.%s but no matching PyTorch wheel; installing CPU build." % system_cuda)
-    version, flavor, has_cuda = current_variant()
+    version, flavor = current_variant()
     config = InstallerConfig(
         desired_build_tag=desired_channel.tag if desired_channel else None,
         current_version=version,
@@ -231,8 +276,8 @@ def main() -> int:
 
     install_openclip(**pip_kwargs)
 
-    has_cuda_after = check_cuda_via_subprocess()
-    if desired_channel and not has_cuda_after:
+    # A fresh interpreter is required to see the newly installed wheel; only CUDA targets need the probe.
+    if desired_channel and not check_cuda_via_subprocess():
         print("Warning: PyTorch could not access CUDA; running in CPU mode.")
     else:
         print("PyTorch installation complete.")
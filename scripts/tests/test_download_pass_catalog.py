@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+from scripts import download_pass_catalog
+
+
+def test_interleave_by_host_round_robins_and_keeps_sample_order():
+    urls = ["http://a/1", "http://a/2", "http://a/3", "http://b/1", "http://c/1", "http://b/2"]
+    jobs = [(url, Path(f"{idx}.jpg")) for idx, url in enumerate(urls)]
+
+    ordered = download_pass_catalog.interleave_by_host(jobs)
+
+    assert [url for url, _ in ordered] == [
+        "http://a/1",
+        "http://b/1",
+        "http://c/1",
+        "http://a/2",
+        "http://b/2",
+        "http://a/3",
+    ]
+
+
+def test_healthy_hosts_keep_downloading_while_a_failing_host_backs_off(tmp_path, monkeypatch):
+    backoff = 0.5
+    attempts_at = {}
+
+    def fake_download(url, dest, *, timeout):
+        attempts_at.setdefault(url, []).append(time.monotonic())
+        time.sleep(0.005)
+        if "down.example" in url:
+            raise RuntimeError("HTTP 503")
+        return dest
+
+    monkeypatch.setattr(download_pass_catalog, "download_binary", fake_download)
+    monkeypatch.setattr(download_pass_catalog, "backoff_delay", lambda delay, attempt: delay)
+    # Host-sorted worst case: the failing host's whole backlog comes before any healthy job.
+    bad = [f"http://down.example/{idx}" for idx in range(6)]
+    good = [f"http://up{idx % 3}.example/{idx}" for idx in range(6)]
+    jobs = [(url, tmp_path / f"{idx}.jpg") for idx, url in enumerate(bad + good)]
+
+    results = {
+        url: error
+        for url, _, error in download_pass_catalog.run_downloads(jobs, workers=1, attempts=2, delay=backoff)
+    }
+
+    assert all(results[url] is None for url in good)
+    assert all(isinstance(results[url], RuntimeError) for url in bad)
+    assert all(len(attempts_at[url]) == 2 for url in bad)
+    first_retry = min(times[1] for url, times in attempts_at.items() if url in bad)
+    # Every healthy download ran during the failing host's cooldown, not after it.
+    assert max(attempts_at[url][0] for url in good) < first_retry
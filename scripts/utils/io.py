@@ -1,9 +1,37 @@
 from __future__ import annotations
 
+import contextlib
+import functools
+import hashlib
+import http.client
+import json
+import os
 import ssl
+import tempfile
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Dict, Optional, Set, Tuple
 from urllib import request
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    import httpx
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+_CHUNK_BYTES = 64 * 1024
+# Remote fetch_text bodies with their validators, so unchanged sources come back as a 304.
+TEXT_CACHE_DIR = Path(tempfile.gettempdir()) / "find_similiar_cache"
+# Download directories already created by this process; checked before mkdir on every download.
+_created_dirs: Set[Path] = set()
+# Per worker thread: keep-alive connections keyed by (scheme, host[:port]) and one chunk buffer.
+_connections = threading.local()
 
 
 def ensure_directory(path: Path) -> Path:
@@ -11,29 +39,198 @@ def ensure_directory(path: Path) -> Path:
     return path
 
 
-def fetch_text(source: str, *, insecure: bool = False, timeout: int = 60) -> str:
+@functools.lru_cache(maxsize=None)
+def _ssl_context(insecure: bool = False) -> ssl.SSLContext:
+    """Shared TLS context; building one parses the whole system CA bundle."""
+    context = ssl.create_default_context()
+    if insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def fetch_text(
+    source: str,
+    *,
+    insecure: bool = False,
+    timeout: int = 60,
+    cache_dir: Optional[Path] = TEXT_CACHE_DIR,
+) -> str:
+    """
+    Read `source` as UTF-8 from a local path or URL. Remote bodies are cached in `cache_dir` (None
+    disables it) with their ETag / Last-Modified, and later calls send a conditional GET.
+    """
     path = Path(source)
     if path.exists():
         return path.read_text(encoding="utf-8")
 
-    context: Optional[ssl.SSLContext] = None
-    if insecure:
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
+    cached_body: Optional[Path] = None
+    headers: Dict[str, str] = {}
+    if cache_dir is not None:
+        key = hashlib.blake2b(source.encode("utf-8"), digest_size=16).hexdigest()
+        cached_body, cached_meta = cache_dir / f"{key}.body", cache_dir / f"{key}.meta"
+        if cached_body.exists():
+            headers = _validator_headers(cached_meta)
 
-    with request.urlopen(source, timeout=timeout, context=context) as resp:
-        return resp.read().decode("utf-8")
+    try:
+        with request.urlopen(
+            request.Request(source, headers=headers), timeout=timeout, context=_ssl_context(insecure)
+        ) as resp:
+            body = resp.read()
+            etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    except HTTPError as exc:
+        if exc.code != 304 or not headers:
+            raise
+        return cached_body.read_text(encoding="utf-8")
+
+    if cached_body is not None and (etag or last_modified):
+        # A cache that cannot be written only costs the next run a full download.
+        with contextlib.suppress(OSError):
+            ensure_directory(cache_dir)
+            _replace_file(cached_body, body)
+            _replace_file(cached_meta, json.dumps({"etag": etag, "last_modified": last_modified}).encode())
+    return body.decode("utf-8")
+
+
+def _validator_headers(meta_path: Path) -> Dict[str, str]:
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _replace_file(path: Path, data: bytes) -> None:
+    partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    partial.write_bytes(data)
+    os.replace(partial, path)
 
 
 def download_binary(url: str, dest: Path, *, timeout: int = 60) -> Path:
     """
     Download the resource at `url` to `dest`. Raises RuntimeError if the request fails.
+
+    With `httpx[http2]` installed, all threads share one client that multiplexes their requests over a
+    single HTTP/2 connection per host. Otherwise each calling thread keeps its own HTTP/1.1 keep-alive
+    connections, so repeated downloads from the same host still skip the TCP and TLS handshakes. The
+    body is streamed to disk through a reused per-thread buffer and only renamed to `dest` once complete.
     """
-    ensure_directory(dest.parent)
+    if dest.parent not in _created_dirs:
+        _created_dirs.add(ensure_directory(dest.parent))
+    partial = dest.with_name(f"{dest.name}.part")
     try:
-        with request.urlopen(url, timeout=timeout) as resp:
-            dest.write_bytes(resp.read())
+        with open(partial, "wb", buffering=0) as sink:
+            if HTTP2_AVAILABLE:
+                _get_http2(url, sink, timeout=timeout)
+            else:
+                _get(url, sink, timeout=timeout)
+        os.replace(partial, dest)
         return dest
     except Exception as exc:
+        partial.unlink(missing_ok=True)
         raise RuntimeError(f"failed to download {url}") from exc
+
+
+@functools.lru_cache(maxsize=None)
+def _http2_client() -> "httpx.Client":
+    # httpx clients are thread-safe; identity encoding keeps Content-Length equal to the bytes written.
+    return httpx.Client(
+        http2=True,
+        verify=_ssl_context(),
+        follow_redirects=True,
+        max_redirects=_MAX_REDIRECTS,
+        headers={"User-Agent": "Python-urllib", "Accept-Encoding": "identity"},
+    )
+
+
+def _get_http2(url: str, sink: BinaryIO, *, timeout: int) -> None:
+    with _http2_client().stream("GET", url, timeout=timeout) as response:
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        _preallocate(sink, response.headers.get("Content-Length"))
+        for chunk in response.iter_raw(_CHUNK_BYTES):
+            sink.write(chunk)
+
+
+def _get(url: str, sink: BinaryIO, *, timeout: int, redirects: int = _MAX_REDIRECTS) -> None:
+    parts = urlsplit(url)
+    if parts.scheme not in {"http", "https"}:
+        raise ValueError(f"unsupported URL scheme {parts.scheme!r}")
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    key = (parts.scheme, parts.netloc)
+    pool: Dict[Tuple[str, str], http.client.HTTPConnection] = _connections.__dict__.setdefault("pool", {})
+    reused = key in pool
+    try:
+        location = _request(pool, key, target, sink, timeout)
+    except (http.client.HTTPException, OSError):
+        if not reused:
+            raise
+        # The server closed the idle keep-alive connection; retry once on a fresh one.
+        sink.seek(0)
+        sink.truncate()
+        location = _request(pool, key, target, sink, timeout)
+    if location is not None:
+        if redirects <= 0:
+            raise RuntimeError("too many redirects")
+        _get(urljoin(url, location), sink, timeout=timeout, redirects=redirects - 1)
+
+
+def _request(
+    pool: Dict[Tuple[str, str], http.client.HTTPConnection],
+    key: Tuple[str, str],
+    target: str,
+    sink: BinaryIO,
+    timeout: int,
+) -> Optional[str]:
+    """GET `target`, streaming a 2xx body into `sink`. Returns the Location of a redirect, else None."""
+    connection = pool.get(key)
+    if connection is None:
+        scheme, netloc = key
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(netloc, timeout=timeout, context=_ssl_context())
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=timeout)
+        pool[key] = connection
+    try:
+        connection.request("GET", target, headers={"User-Agent": "Python-urllib", "Connection": "keep-alive"})
+        response = connection.getresponse()
+        location = response.getheader("Location") if response.status in _REDIRECT_STATUSES else None
+        if location is not None or response.status >= 400:
+            # Drain the (small) body so the connection can be reused.
+            response.read()
+        else:
+            _stream_body(response, sink)
+    except BaseException:
+        pool.pop(key, None)
+        connection.close()
+        raise
+    if response.will_close:
+        pool.pop(key, None)
+        connection.close()
+    if location is None and response.status >= 400:
+        raise RuntimeError(f"HTTP {response.status}")
+    return location
+
+
+def _stream_body(response: http.client.HTTPResponse, sink: BinaryIO) -> None:
+    _preallocate(sink, response.getheader("Content-Length"))
+    buffer = getattr(_connections, "buffer", None)
+    if buffer is None:
+        buffer = _connections.buffer = memoryview(bytearray(_CHUNK_BYTES))
+    while True:
+        read = response.readinto(buffer)
+        if not read:
+            break
+        sink.write(buffer[:read])
+
+
+def _preallocate(sink: BinaryIO, length: Optional[str]) -> None:
+    if length and length.isdigit() and hasattr(os, "posix_fallocate"):
+        # Reserve the whole file up front so concurrent downloads do not fragment it.
+        with contextlib.suppress(OSError):
+            os.posix_fallocate(sink.fileno(), 0, int(length))
@@ -1,10 +1,19 @@
 from __future__ import annotations
 
+import random
 import time
-from typing import Callable, Optional, Sequence, Type, TypeVar
+from typing import Callable, Literal, Optional, Sequence, Type, TypeVar
 
 T = TypeVar("T")
 
+# Module-level so tests can reseed it; Random() itself seeds from os.urandom.
+_jitter = random.Random()
+
+
+def backoff_delay(delay: float, attempt: int, *, max_delay: float = 30.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(max_delay, delay * 2 ** (attempt - 1))]."""
+    return _jitter.uniform(0, min(max_delay, delay * 2 ** (attempt - 1)))
+
 
 def run_with_retry(
     func: Callable[[], T],
@@ -13,26 +22,32 @@ def run_with_retry(
     delay: float = 1.0,
     exceptions: Sequence[Type[BaseException]] = (Exception,),
     on_retry: Optional[Callable[[int, BaseException], None]] = None,
+    backoff: Literal["fixed", "exp_jitter"] = "exp_jitter",
+    max_delay: float = 30.0,
 ) -> T:
     """
-    Execute `func`, retrying on failure up to `attempts` times with a fixed delay.
+    Execute `func`, retrying on failure up to `attempts` times.
     Raises the last exception if all attempts fail.
+
+    By default the wait before retry n is drawn from [0, delay * 2 ** (n - 1)] (capped at `max_delay`),
+    so concurrent callers failing together do not retry in lockstep; `backoff="fixed"` always waits `delay`.
     """
     if attempts < 1:
         raise ValueError("attempts must be >= 1")
     if delay < 0:
         raise ValueError("delay must be >= 0")
 
+    retry_on = tuple(exceptions)
     for attempt in range(1, attempts + 1):
         try:
             return func()
-        except tuple(exceptions) as exc:
+        except retry_on as exc:
             if attempt >= attempts:
                 raise
             if on_retry:
                 on_retry(attempt, exc)
             if delay:
-                time.sleep(delay)
+                time.sleep(delay if backoff == "fixed" else backoff_delay(delay, attempt, max_delay=max_delay))
 
     # This should never be reached because the loop either returns or raises.
     raise RuntimeError("run_with_retry exhausted attempts without returning")